@@ -1,22 +1,20 @@
 import streamlit as st
 import os
-import fitz  # PyMuPDF
 import sys
 
 # Add root directory to path to import utils
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
 try:
-    from utils.image_processing import describe_image
+    from utils.chat_history import append_message, clear_history, history_context, init_history, render_history
+    from utils.doc_watcher import running_watcher, stop_watchers, watch_index
+    from utils.embeddings import resolve_backend
+    from utils.image_processing import THUMBNAIL_WIDTH, display_image
+    from utils.knowledge_base import build_index, format_source, iter_chunks, iter_documents, load_index
+    from utils.tracing import Trace
 except ImportError:
-    st.error("❌ utility module not found. Check 'utils/image_processing.py'")
+    st.error("❌ utility module not found. Check the 'utils/' folder.")
     st.stop()
 
-# LangChain
-from langchain_community.vectorstores import FAISS
-from langchain_text_splitters import RecursiveCharacterTextSplitter
-from langchain_core.documents import Document
-from langchain_openai import OpenAIEmbeddings
-
 # OpenAI
 from openai import OpenAI
 
@@ -36,89 +34,87 @@ except Exception:
     st.error("❌ OpenAI API Key missing in Streamlit secrets.")
     st.stop()
 
+# Embedding backend: "openai" (default) or "local" (offline hashing embeddings)
+try:
+    EMBEDDING_BACKEND = resolve_backend(st.secrets.get("EMBEDDING_BACKEND"))
+except ValueError as e:
+    st.error(f"❌ {e}")
+    st.stop()
+
 
 # ================= LOAD DOCUMENTS & VECTOR DB =================
 def load_and_process_documents():
-    """Reads all PDFs, text files, and IMAGES from doc_dir and returns chunks."""
-    docs = []
+    """Streams chunks of all PDFs, text files, and IMAGES from doc_dir."""
+    # iter_documents extracts PDF pages on a process pool and describes unregistered images
+    # on a background thread, yielding each document as soon as it is ready; iter_chunks
+    # splits them as they arrive, so embedding starts while extraction is still running
+    return iter_chunks(iter_documents(DOC_DIR, client=client))
+
+
+@st.cache_resource
+def get_vector_db():
+    """Returns the sharded FAISS + BM25 index persisted in VECTOR_STORE_PATH."""
+    # Check if index exists on disk (and was built with the configured backend)
+    try:
+        loaded = load_index(VECTOR_STORE_PATH, EMBEDDING_BACKEND)
+        if loaded:
+            return loaded
+    except Exception as e:
+        st.warning(f"⚠️ Could not load existing index: {e}. Rebuilding...")
     
+    # If not, build it and save (embedding runs while PDFs are still being extracted)
     status_text = st.empty()
     status_text.info("📂 Scanning documents and analyzing images (this may take a while)...")
-    
-    # Initialize Text Splitter
-    splitter = RecursiveCharacterTextSplitter(
-        chunk_size=500,
-        chunk_overlap=80
-    )
 
-    for root, _, files in os.walk(DOC_DIR):
-        for file in files:
-            path = os.path.join(root, file)
-            # Relative path for metadata
-            rel_path = os.path.relpath(path, DOC_DIR)
-            
-            # --- PROCESS PDF ---
-            if file.lower().endswith(".pdf"):
-                with fitz.open(path) as pdf:
-                    text = "\n".join(page.get_text() for page in pdf)
-                if text.strip():
-                    docs.append(Document(page_content=text, metadata={"source": rel_path, "type": "text"}))
-
-            # --- PROCESS TEXT/MD ---
-            elif file.lower().endswith((".md", ".txt")):
-                with open(path, "r", encoding="utf-8") as f:
-                    text = f.read()
-                if text.strip():
-                    docs.append(Document(page_content=text, metadata={"source": rel_path, "type": "text"}))
-
-            # --- PROCESS IMAGES (NEW) ---
-            elif file.lower().endswith((".jpg", ".jpeg", ".png")):
-                # Generate description using GPT-4o-mini
-                try:
-                    description = describe_image(client, path)
-                    # We store the description as the 'content' so we can vector search it
-                    # But we mark type='image' so we know to display the image itself
-                    docs.append(Document(
-                        page_content=f"Image related to: {rel_path}\nDescription: {description}", 
-                        metadata={"source": rel_path, "type": "image", "full_path": path}
-                    ))
-                except Exception as e:
-                    print(f"Skipping image {file}: {e}")
-            else:
-                continue
+    db = build_index(load_and_process_documents(), EMBEDDING_BACKEND, folder=VECTOR_STORE_PATH)
 
     status_text.empty()
-    
-    # Split big text docs into chunks (images are usually small enough, but good to ensure consistency)
-    return splitter.split_documents(docs)
+    return db
 
 
-@st.cache_resource
-def get_vector_db():
-    embeddings = OpenAIEmbeddings(model="text-embedding-3-small")
-
-    # Check if index exists on disk
-    if os.path.exists(VECTOR_STORE_PATH):
-        try:
-            return FAISS.load_local(VECTOR_STORE_PATH, embeddings, allow_dangerous_deserialization=True)
-        except Exception as e:
-            st.warning(f"⚠️ Could not load existing index: {e}. Rebuilding...")
-    
-    # If not, build it and save
-    chunks = load_and_process_documents()
-    if not chunks:
-        return None
-        
-    db = FAISS.from_documents(chunks, embeddings)
-    db.save_local(VECTOR_STORE_PATH)
-    return db
+def toggle_live_reindex():
+    """
+    Starts / stops the process-wide watcher (changed files in DOC_DIR are re-indexed
+    incrementally into the shared index). Only runs when a user flips the toggle,
+    never as a side effect of another session's rerun.
+    """
+    if st.session_state.live_reindex:
+        db = get_vector_db()
+        if db:
+            watch_index(db, VECTOR_STORE_PATH, DOC_DIR, client=client)
+    else:
+        stop_watchers()
 
 
 # ================= SIDEBAR =================
 with st.sidebar:
     st.header("⚙️ Settings")
 
+    retrieval_mode = st.radio(
+        "🔎 Retrieval",
+        ["hybrid", "vector", "keyword"],
+        format_func={
+            "hybrid": "Hybrid (BM25 + vectors)",
+            "vector": "Vector only",
+            "keyword": "Keyword only (offline)",
+        }.get,
+        help="Keyword mode answers from the local BM25 index without any embeddings API call.",
+    )
+
+    show_trace = st.checkbox("⏱️ Show latency breakdown", help="Per-stage timings of the last answer (also logged to rag_traces.jsonl).")
+
+    # Shared by every session: the toggle shows whether the watcher is running
+    st.session_state.live_reindex = running_watcher() is not None
+    st.toggle(
+        "🔁 Live reindex",
+        key="live_reindex",
+        on_change=toggle_live_reindex,
+        help="Watches the documents folder (for every user of this server) and indexes new or changed files "
+             "within seconds, without a full rebuild.",
+    )
+
     if st.button("🔄 Force Rebuild Knowledge Base"):
+        stop_watchers()
         st.cache_resource.clear()
         if os.path.exists(VECTOR_STORE_PATH):
             import shutil
@@ -126,15 +122,14 @@ with st.sidebar:
         st.rerun()
 
     if st.button("🧹 Clear Chat History"):
-        st.session_state.messages = []
+        clear_history(st.session_state)
         st.rerun()
 
 
 # ================= INIT =================
 st.title("🛠️ Work Procedures Assistant")
 
-if "messages" not in st.session_state:
-    st.session_state.messages = []
+init_history(st.session_state)
 
 # Load DB (Persistent)
 db = get_vector_db()
@@ -143,89 +138,115 @@ if not db:
     st.warning("⚠️ No documents found. Please add files to the 'documents' folder.")
     st.stop()
 
+watcher = running_watcher()
+if watcher:
+    last = watcher.last_result or {}
+    st.sidebar.caption(
+        f"👀 Watching `{DOC_DIR}/` · index {db.version} · {watcher.updates} live update(s)"
+        + (f" · last: {len(last.get('changed', []))} changed, {len(last.get('removed', []))} removed" if last else "")
+    )
+    if watcher.last_error:
+        st.sidebar.warning(f"Live reindex failed: {watcher.last_error}")
+
 
 # ================= CHAT HISTORY =================
-for msg in st.session_state.messages:
+def render_message(msg, compact):
+    width = THUMBNAIL_WIDTH if compact else IMAGE_WIDTH
     with st.chat_message(msg["role"]):
         st.markdown(msg["content"])
-        # Display images if any were associated with this message
+        # Display images if any were associated with this message (thumbnails for older turns)
         for img_path in msg.get("images", []):
             if os.path.exists(img_path):
-                st.image(img_path, width=IMAGE_WIDTH)
+                st.image(display_image(img_path, width), width=width)
+
+
+# Only the last turns are rendered; older ones load on demand
+render_history(st.session_state, render_message)
 
 
 # ================= CHAT INPUT =================
 if prompt := st.chat_input("Ask a question about procedures..."):
-    st.session_state.messages.append({"role": "user", "content": prompt})
+    append_message(st.session_state, {"role": "user", "content": prompt})
     with st.chat_message("user"):
         st.markdown(prompt)
 
-    # ---------- RAG SEARCH ----------
-    # Retrieve top k (mixed text and images)
-    results = db.similarity_search(prompt, k=4)
-    
-    context_text_parts = []
-    retrieved_images = []
-
-    for doc in results:
-        # Build context for LLM
-        context_text_parts.append(f"[{doc.metadata.get('source')}]: {doc.page_content}")
-        
-        # Collect images to display
-        if doc.metadata.get("type") == "image":
-            full_path = doc.metadata.get("full_path")
-            if full_path and full_path not in retrieved_images:
-                retrieved_images.append(full_path)
-
-    context = "\n\n".join(context_text_parts)
-    
-    # ---------- GENERATE ANSWER ----------
-    history_context = "\n".join(
-        f"{m['role']}: {m['content']}"
-        for m in st.session_state.messages[-5:]
-    )
-
-    llm_response = client.chat.completions.create(
-        model="gpt-4o-mini",
-        messages=[
-            {
-                "role": "system",
-                "content": (
-                    "You are a work procedures assistant. "
-                    "Use the provided context (which includes text and descriptions of images) to answer. "
-                    "If the answer involves an image that was retrieved, mention it effectively."
-                    "If the answer is not in the documents, say exactly: 'This situation is not documented yet.'"
-                )
-            },
+    with Trace("ChatBot", mode=retrieval_mode, k=4, index_version=db.version) as trace:
+        # ---------- RAG SEARCH ----------
+        # Retrieve top k text chunks + image hits in their own slots, from the routed category shards
+        with trace.stage("retrieval"):
+            results = db.search(prompt, k=4, mode=retrieval_mode)
+        trace.set(n_results=len(results))
+
+        context_text_parts = []
+        retrieved_images = []
+
+        for doc in results:
+            # Build context for LLM
+            context_text_parts.append(f"[{format_source(doc)}]: {doc.page_content}")
+
+            # Collect images to display
+            if doc.metadata.get("type") == "image":
+                full_path = doc.metadata.get("full_path")
+                if full_path and full_path not in retrieved_images:
+                    retrieved_images.append(full_path)
+
+        context = "\n\n".join(context_text_parts)
+
+        # ---------- GENERATE ANSWER ----------
+        # Rolling summary of older turns + last messages: constant prompt size
+        history = history_context(st.session_state)
+
+        with trace.stage("completion"):
+            llm_response = client.chat.completions.create(
+                model="gpt-4o-mini",
+                messages=[
+                    {
+                        "role": "system",
+                        "content": (
+                            "You are a work procedures assistant. "
+                            "Use the provided context (which includes text and descriptions of images) to answer. "
+                            "If the answer involves an image that was retrieved, mention it effectively. "
+                            "When a source label includes a page (e.g. 'manual.pdf p.12'), cite it. "
+                            "If the answer is not in the documents, say exactly: 'This situation is not documented yet.'"
+                        )
+                    },
+                    {
+                        "role": "user",
+                        "content": (
+                            f"History:\n{history}\n\n"
+                            f"Context/Documentation:\n{context}\n\n"
+                            f"Question: {prompt}"
+                        )
+                    }
+                ]
+            )
+
+        trace.set_usage(llm_response)
+        response_content = llm_response.choices[0].message.content.strip()
+
+        # ---------- DISPLAY ----------
+        with trace.stage("render"), st.chat_message("assistant"):
+            st.markdown(response_content)
+
+            # If the LLM says it's not documented, don't show images (unless they seem very relevant? strict logic for now)
+            if response_content != "This situation is not documented yet.":
+                for img in retrieved_images:
+                    if os.path.exists(img):
+                        st.image(display_image(img, IMAGE_WIDTH), caption=os.path.basename(img), width=IMAGE_WIDTH)
+                    else:
+                        st.warning(f"Image not found: {img}")
+
+        append_message(
+            st.session_state,
             {
-                "role": "user",
-                "content": (
-                    f"History:\n{history_context}\n\n"
-                    f"Context/Documentation:\n{context}\n\n"
-                    f"Question: {prompt}"
-                )
+                "role": "assistant",
+                "content": response_content,
+                "images": retrieved_images if response_content != "This situation is not documented yet." else []
             }
-        ]
-    )
+        )
 
-    response_content = llm_response.choices[0].message.content.strip()
-
-    # ---------- DISPLAY ----------
-    with st.chat_message("assistant"):
-        st.markdown(response_content)
-        
-        # If the LLM says it's not documented, don't show images (unless they seem very relevant? strict logic for now)
-        if response_content != "This situation is not documented yet.":
-            for img in retrieved_images:
-                if os.path.exists(img):
-                    st.image(img, caption=os.path.basename(img), width=IMAGE_WIDTH)
-                else:
-                    st.warning(f"Image not found: {img}")
-
-    st.session_state.messages.append(
-        {
-            "role": "assistant",
-            "content": response_content,
-            "images": retrieved_images if response_content != "This situation is not documented yet." else []
-        }
-    )
+    record = trace.record
+    if show_trace:
+        with st.sidebar:
+            st.caption(f"⏱️ Last answer · index {record.get('index_version')}")
+            st.json(record["stages_ms"])
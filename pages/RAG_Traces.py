@@ -0,0 +1,51 @@
+import streamlit as st
+import os
+import sys
+
+import pandas as pd
+
+# Add root directory to path to import utils
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from utils.tracing import STAGES, TRACE_PATH, failed, load_traces, stage_summary
+
+
+# ================= CONFIG =================
+st.set_page_config(page_title="RAG Latency", layout="wide")
+st.title("⏱️ RAG Latency Traces")
+st.caption(f"Per-stage timings written by the chatbot pages to `{TRACE_PATH}`.")
+
+with st.sidebar:
+    limit = st.number_input("Last N traces", min_value=10, max_value=100000, value=1000, step=100)
+    group_by = st.selectbox("Group by", ["(none)", "page", "mode", "k", "index_version"])
+
+traces = load_traces(limit=int(limit))
+if not traces:
+    st.info("No traces yet. Ask something in ChatBot / ChatBotV2 first.")
+    st.stop()
+
+# ================= SUMMARY =================
+st.subheader(f"p50 / p95 per stage ({len(traces)} requests, {len(failed(traces))} failed)")
+if group_by == "(none)":
+    st.dataframe(pd.DataFrame(stage_summary(traces)), hide_index=True, use_container_width=True)
+else:
+    groups = {}
+    for t in traces:
+        groups.setdefault(str(t.get(group_by)), []).append(t)
+    for value, items in sorted(groups.items()):
+        st.markdown(f"**{group_by} = {value}** · {len(items)} requests, {len(failed(items))} failed")
+        st.dataframe(pd.DataFrame(stage_summary(items)), hide_index=True, use_container_width=True)
+
+# ================= RAW =================
+with st.expander("Raw traces"):
+    rows = [{**{k: v for k, v in t.items() if k != "stages_ms"}, **t.get("stages_ms", {})} for t in traces]
+    df = pd.DataFrame(rows)
+    cols = [c for c in df.columns if c not in STAGES] + [s for s in STAGES if s in df.columns]
+    st.dataframe(df[cols].iloc[::-1], hide_index=True, use_container_width=True)
+
+errors = failed(traces)
+if errors:
+    with st.expander(f"Failed requests ({len(errors)})"):
+        st.dataframe(
+            pd.DataFrame([{k: t.get(k) for k in ("ts", "page", "mode", "index_version", "error")} for t in errors]).iloc[::-1],
+            hide_index=True, use_container_width=True,
+        )
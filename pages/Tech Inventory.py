@@ -1,116 +1,58 @@
 import streamlit as st
+import os
 import sqlite3
+import sys
 from datetime import datetime, date
+from functools import partial
 import pandas as pd
 from streamlit_qrcode_scanner import qrcode_scanner
 
+# Add root directory to path to import utils
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from utils.inventory_db import (
+    DB_PATH, OVERDUE_DAYS, AssignmentClosed, ConnectionPool, ItemNotAvailable, bulk_add_items, data_versions, existing_serials,
+    fts_query, init_db, issue_item, issue_serial, tables_in, update_assignment,
+)
+from utils.inventory_export import EXPORT_FORMATS, EXPORTS, export_file, export_query
+from utils.inventory_import import DATE_FORMATS, import_records
+
 # =========================
 # CONFIG
 # =========================
 st.set_page_config(page_title="Field Inventory Tracker", layout="wide")
-DB_PATH = "inventory.db"
 
 # =========================
 # DB HELPERS
 # =========================
-def get_conn():
-    # More robust SQLite settings for Streamlit + reruns
-    conn = sqlite3.connect(DB_PATH, check_same_thread=False, timeout=30)
-    conn.execute("PRAGMA foreign_keys = ON;")
-    conn.execute("PRAGMA journal_mode = WAL;")
-    conn.execute("PRAGMA synchronous = NORMAL;")
-    return conn
-
-def init_db():
-    conn = get_conn()
-    cur = conn.cursor()
-
-    cur.execute("""
-    CREATE TABLE IF NOT EXISTS technicians (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        name TEXT NOT NULL UNIQUE,
-        email TEXT,
-        active INTEGER NOT NULL DEFAULT 1 CHECK(active IN (0,1)),
-        created_at TEXT NOT NULL
-    );
-    """)
-
-    cur.execute("""
-    CREATE TABLE IF NOT EXISTS item_types (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        name TEXT NOT NULL UNIQUE
-    );
-    """)
-
-    cur.execute("""
-    CREATE TABLE IF NOT EXISTS items (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        serial_number TEXT NOT NULL UNIQUE,
-        asset_tag TEXT,
-        item_type_id INTEGER NOT NULL,
-        description TEXT,
-        status TEXT NOT NULL CHECK(status IN ('AVAILABLE','IN_FIELD','INSTALLED','LOST','DAMAGED')),
-        created_at TEXT NOT NULL,
-        FOREIGN KEY(item_type_id) REFERENCES item_types(id)
-    );
-    """)
+@st.cache_resource
+def get_pool():
+    # One connection per script thread, PRAGMAs applied once (shared by all sessions)
+    pool = ConnectionPool(DB_PATH)
+    init_db(pool)
+    return pool
 
-    cur.execute("""
-    CREATE TABLE IF NOT EXISTS assignments (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        item_id INTEGER NOT NULL,
-        technician_id INTEGER NOT NULL,
-        request_date TEXT,
-        issued_date TEXT,
-        installed_date TEXT,
-        returned_date TEXT,
-        location_place_name TEXT,
-        rdl TEXT,
-        notes TEXT,
-        closed INTEGER NOT NULL DEFAULT 0 CHECK(closed IN (0,1)),
-        created_at TEXT NOT NULL,
-        FOREIGN KEY(item_id) REFERENCES items(id),
-        FOREIGN KEY(technician_id) REFERENCES technicians(id)
-    );
-    """)
-
-    cur.execute("""
-    CREATE INDEX IF NOT EXISTS idx_assignments_open
-    ON assignments(closed, technician_id, item_id);
-    """)
+def get_conn():
+    return get_pool().connection()
 
-    # Helpful indexes
-    cur.execute("CREATE INDEX IF NOT EXISTS idx_assignments_item ON assignments(item_id);")
-    cur.execute("CREATE INDEX IF NOT EXISTS idx_assignments_tech_created ON assignments(technician_id, created_at);")
-    cur.execute("CREATE INDEX IF NOT EXISTS idx_items_type_status ON items(item_type_id, status);")
+def transaction(*tables):
+    return get_pool().transaction(*tables)
 
-    conn.commit()
-    conn.close()
+@st.cache_data(max_entries=256, show_spinner=False)
+def _cached_query(query, params, versions):
+    return pd.read_sql_query(query, get_conn(), params=params)
 
-@st.cache_data(ttl=5)
 def qdf(query, params=None):
-    conn = get_conn()
-    df = pd.read_sql_query(query, conn, params=params or ())
-    conn.close()
-    return df
+    # Cached until one of the tables in the query is written (see transaction())
+    versions = data_versions(get_conn(), tables_in(query))
+    return _cached_query(query, tuple(params or ()), versions)
 
 def exec_sql(query, params=None):
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.execute(query, params or ())
-    conn.commit()
-    rowcount = cur.rowcount
-    conn.close()
-    return rowcount
+    with transaction(*tables_in(query)) as conn:
+        return conn.execute(query, params or ()).rowcount
 
 def insert_sql(query, params=None):
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.execute(query, params or ())
-    conn.commit()
-    last_id = cur.lastrowid
-    conn.close()
-    return last_id
+    with transaction(*tables_in(query)) as conn:
+        return conn.execute(query, params or ()).lastrowid
 
 def to_iso(d):
     if d is None:
@@ -140,32 +82,66 @@ def normalize_scan_text(x):
     s = " ".join(s.split())
     return s
 
-# =========================
-# INIT
-# =========================
-init_db()
+def like_prefix(text):
+    # 'abc' -> 'abc%' com % e _ escapados (usado com ESCAPE '\')
+    return text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+
+def item_label(r):
+    base = f"{r['item_type']} (SN: {r['serial_number']})"
+    tag = f" | {r['asset_tag']}" if (r["asset_tag"] or "").strip() else ""
+    desc = f" - {r['description']}" if (r["description"] or "").strip() else ""
+    return base + tag + desc
+
+ITEM_PICKER_LIMIT = 50
 
 st.title("🧰 Field Inventory Tracker (SST / Carmanah / Tools)")
 st.caption("Cadastro de técnicos + itens via scanner (câmera traseira) + movimentações (request → issued → installed → returned).")
 
-tabs = st.tabs([
+TABS = [
     "📌 Friday Check",
     "👤 Technicians",
     "📦 Item Types",
     "🧾 Items (Scan SN)",
     "🚚 Quick Issue (Scan → Assign)",   # ✅ NOVA ABA
     "🔁 Assignments",
-    "📤 Export"
-])
+    "📤 Export",
+    "📥 Import",
+    "🔎 Search"
+]
+# Navegação em vez de st.tabs: só a aba visível executa (queries, scanner, exports)
+tab = st.radio("Seção", TABS, horizontal=True, key="inv_tab", label_visibility="collapsed")
 
 # =========================
 # TAB 0: Friday Check
 # =========================
-with tabs[0]:
+if tab == TABS[0]:
     st.subheader("📌 Friday Check (itens em posse / em andamento)")
 
     techs = qdf("SELECT id, name FROM technicians WHERE active=1 ORDER BY name;")
-    items_in_field = qdf("""
+
+    f1, f2, f3 = st.columns([1.6, 1, 1])
+    with f1:
+        selected_tech = st.selectbox(
+            "Filtrar por técnico (opcional)",
+            options=["(All)"] + (techs["name"].tolist() if len(techs) else []),
+            key="friday_filter_tech"
+        )
+    with f2:
+        overdue_days = st.number_input("Overdue após (dias)", min_value=1, value=OVERDUE_DAYS, step=1, key="friday_overdue_days")
+    with f3:
+        only_overdue = st.checkbox("Só overdue", key="friday_only_overdue")
+
+    # Filtro, data de referência e idade calculados no SQL (idx_assignments_open_cover)
+    ref_age = "CAST(julianday(?) - julianday(COALESCE(a.issued_date, a.request_date)) AS INTEGER)"
+    where, params = ["a.closed = 0"], [today_str(), today_str(), int(overdue_days)]
+    if selected_tech != "(All)":
+        where.append("a.technician_id = ?")
+        params.append(int(techs[techs["name"] == selected_tech]["id"].iloc[0]))
+    if only_overdue:
+        where.append(f"{ref_age} >= ?")
+        params += [today_str(), int(overdue_days)]
+
+    df = qdf(f"""
         SELECT
             a.id AS assignment_id,
             t.name AS technician,
@@ -176,6 +152,8 @@ with tabs[0]:
             a.request_date,
             a.issued_date,
             a.installed_date,
+            {ref_age} AS days_since,
+            COALESCE({ref_age} >= ?, 0) AS overdue,
             a.location_place_name,
             a.rdl,
             a.notes
@@ -183,46 +161,27 @@ with tabs[0]:
         JOIN technicians t ON t.id = a.technician_id
         JOIN items i ON i.id = a.item_id
         JOIN item_types it ON it.id = i.item_type_id
-        WHERE a.closed=0
+        WHERE {" AND ".join(where)}
         ORDER BY t.name, it.name;
-    """)
-
-    selected_tech = st.selectbox(
-        "Filtrar por técnico (opcional)",
-        options=["(All)"] + (techs["name"].tolist() if len(techs) else []),
-        key="friday_filter_tech"
-    )
+    """, params)
 
-    if len(items_in_field) == 0:
+    if len(df) == 0:
         st.info("Nenhum assignment aberto.")
     else:
-        df = items_in_field.copy()
-        if selected_tech != "(All)":
-            df = df[df["technician"] == selected_tech].copy()
-
-        def days_since(x):
-            if pd.isna(x) or not x:
-                return None
-            try:
-                d = datetime.fromisoformat(str(x)).date()
-                return (date.today() - d).days
-            except Exception:
-                return None
-
-        df["ref_date"] = df["issued_date"].fillna(df["request_date"])
-        df["days_since"] = df["ref_date"].apply(days_since)
-        df["status"] = df["status"].apply(status_badge)
+        df["status"] = df["status"].map(status_badge)
+        df["overdue"] = df["overdue"].astype(bool)
+        st.caption(f"{len(df)} assignment(s) aberto(s), {int(df['overdue'].sum())} overdue (≥ {int(overdue_days)} dias).")
 
         show_cols = [
             "technician", "item_type", "serial_number", "asset_tag", "status",
-            "request_date", "issued_date", "installed_date", "days_since",
+            "request_date", "issued_date", "installed_date", "days_since", "overdue",
             "location_place_name", "rdl", "notes"
         ]
         st.dataframe(df[show_cols], use_container_width=True, hide_index=True)
 
         st.download_button(
             "⬇️ Baixar CSV do Friday Check",
-            data=df[show_cols].to_csv(index=False).encode("utf-8"),
+            data=partial(df[show_cols].to_csv, index=False),  # só gera o CSV no clique
             file_name=f"friday_check_{today_str()}.csv",
             mime="text/csv",
             key="dl_friday_check"
@@ -231,7 +190,7 @@ with tabs[0]:
 # =========================
 # TAB 1: Technicians
 # =========================
-with tabs[1]:
+if tab == TABS[1]:
     st.subheader("👤 Technicians")
 
     with st.expander("➕ Add Technician", expanded=True):
@@ -258,7 +217,6 @@ with tabs[1]:
                         (tech_name.strip(), tech_email.strip() or None, int(tech_active), datetime.utcnow().isoformat())
                     )
                     st.success("Technician cadastrado.")
-                    st.cache_data.clear()
                     st.rerun()
                 except sqlite3.IntegrityError:
                     st.error("Já existe um technician com esse nome.")
@@ -288,13 +246,12 @@ with tabs[1]:
                     (new_email.strip() or None, int(new_active), int(row["id"]))
                 )
                 st.success("Atualizado.")
-                st.cache_data.clear()
                 st.rerun()
 
 # =========================
 # TAB 2: Item Types
 # =========================
-with tabs[2]:
+if tab == TABS[2]:
     st.subheader("📦 Item Types (categorias)")
 
     with st.expander("➕ Add Item Type", expanded=True):
@@ -310,7 +267,6 @@ with tabs[2]:
                 try:
                     insert_sql("INSERT INTO item_types(name) VALUES (?);", (type_name.strip(),))
                     st.success("Item Type cadastrado.")
-                    st.cache_data.clear()
                     st.rerun()
                 except sqlite3.IntegrityError:
                     st.error("Esse Item Type já existe.")
@@ -322,7 +278,7 @@ with tabs[2]:
 # =========================
 # TAB 3: Items (Scan SN)
 # =========================
-with tabs[3]:
+if tab == TABS[3]:
     st.subheader("🧾 Items (Scan SN com câmera traseira)")
 
     types = qdf("SELECT id, name FROM item_types ORDER BY name;")
@@ -442,12 +398,109 @@ with tabs[3]:
 
                     st.success(f"✅ Item cadastrado com SN: {sn_to_save}")
                     st.session_state.pending_clear_sn = True
-                    st.cache_data.clear()
                     st.rerun()
 
                 except sqlite3.IntegrityError:
                     st.error(f"❌ SN '{sn_to_save}' já existe no sistema (duplicado).")
 
+    # -------------------------
+    # Recebimento em lote: scanner fica ligado, SNs vão para um buffer na sessão
+    # e são gravados de uma vez (um executemany, uma transação)
+    # -------------------------
+    if "inv_bulk_serials" not in st.session_state:
+        st.session_state.inv_bulk_serials = {}   # SN -> já existe no banco?
+    if "inv_bulk_last_cam" not in st.session_state:
+        st.session_state.inv_bulk_last_cam = None
+    if "inv_bulk_msg" not in st.session_state:
+        st.session_state.inv_bulk_msg = None
+    if "inv_bulk_result" not in st.session_state:
+        st.session_state.inv_bulk_result = None
+
+    def bulk_add_serial(raw):
+        sn = normalize_scan_text(raw)
+        buffer = st.session_state.inv_bulk_serials
+        if len(sn) < 3:
+            st.session_state.inv_bulk_msg = f"Código inválido ignorado: '{sn}'"
+        elif sn in buffer:
+            st.session_state.inv_bulk_msg = f"SN {sn} já está na lista."
+        else:
+            buffer[sn] = bool(existing_serials(get_conn(), [sn]))
+            st.session_state.inv_bulk_msg = None
+
+    def on_bulk_wedge():
+        # Leitor USB (keyboard wedge) digita o SN + Enter
+        bulk_add_serial(st.session_state.inv_bulk_wedge)
+        st.session_state.inv_bulk_wedge = ""
+
+    with st.expander("📦 Recebimento em lote (scan contínuo)", expanded=bool(st.session_state.inv_bulk_serials)):
+        result = st.session_state.inv_bulk_result
+        if result:
+            st.success(f"✅ {len(result['inserted'])} itens cadastrados.")
+            if result["existing"]:
+                st.warning(f"{len(result['existing'])} SN(s) já existiam e foram ignorados: " + ", ".join(result["existing"]))
+
+        b1, b2, b3 = st.columns([1.3, 1.3, 1.6])
+        with b1:
+            bulk_type = st.selectbox("Item Type", types["name"].tolist(), key="inv_bulk_type")
+        with b2:
+            bulk_status = st.selectbox("Status", ["AVAILABLE", "IN_FIELD", "INSTALLED", "LOST", "DAMAGED"], key="inv_bulk_status")
+        with b3:
+            bulk_desc = st.text_input("Description (optional)", key="inv_bulk_desc")
+
+        st.text_input(
+            "Leitor USB / digitação (Enter adiciona)",
+            key="inv_bulk_wedge",
+            on_change=on_bulk_wedge,
+            placeholder="Escaneie aqui com o leitor USB"
+        )
+        if st.toggle("📷 Câmera contínua", key="inv_bulk_cam_on"):
+            scanned = qrcode_scanner(key="inv_bulk_scan_live")
+            if scanned and scanned != st.session_state.inv_bulk_last_cam:
+                st.session_state.inv_bulk_last_cam = scanned
+                bulk_add_serial(scanned)
+
+        if st.session_state.inv_bulk_msg:
+            st.warning(st.session_state.inv_bulk_msg)
+
+        buffer = st.session_state.inv_bulk_serials
+        n_existing = sum(buffer.values())
+        m1, m2, m3 = st.columns(3)
+        m1.metric("Na lista", len(buffer))
+        m2.metric("Novos", len(buffer) - n_existing)
+        m3.metric("Já no sistema", n_existing)
+
+        if buffer:
+            st.dataframe(
+                pd.DataFrame(
+                    [{"serial_number": sn, "situação": "⚠️ já existe" if exists else "🆕 novo"}
+                     for sn, exists in reversed(buffer.items())]
+                ),
+                use_container_width=True,
+                hide_index=True,
+                height=min(400, 38 + 35 * len(buffer))
+            )
+
+        s1, s2 = st.columns([2, 1])
+        with s1:
+            if st.button(f"💾 Salvar {len(buffer) - n_existing} itens", type="primary", key="btn_bulk_save",
+                         disabled=(len(buffer) == n_existing), use_container_width=True):
+                type_id = int(types[types["name"] == bulk_type]["id"].iloc[0])
+                inserted, existing = bulk_add_items(
+                    get_pool(), list(buffer), type_id,
+                    status=bulk_status,
+                    description=bulk_desc.strip() or None
+                )
+                st.session_state.inv_bulk_result = {"inserted": inserted, "existing": existing}
+                st.session_state.inv_bulk_serials = {}
+                st.session_state.inv_bulk_msg = None
+                st.rerun()
+        with s2:
+            if st.button("🗑️ Limpar lista", key="btn_bulk_clear", use_container_width=True):
+                st.session_state.inv_bulk_serials = {}
+                st.session_state.inv_bulk_result = None
+                st.session_state.inv_bulk_msg = None
+                st.rerun()
+
     st.divider()
 
     st.markdown("### 📋 Últimos Itens Cadastrados")
@@ -489,7 +542,7 @@ with tabs[3]:
 # =========================
 # TAB 4: Quick Issue (Scan → Assign)  ✅ NOVA ABA
 # =========================
-with tabs[4]:
+if tab == TABS[4]:
     st.subheader("🚚 Quick Issue (Scan → Assign)")
     st.caption("Aqui você cadastra (se precisar) e já entrega o item para um técnico em um único fluxo.")
 
@@ -610,66 +663,24 @@ with tabs[4]:
         tech_id = int(techs[techs["name"] == tech_pick]["id"].iloc[0])
         type_id = int(types[types["name"] == type_pick]["id"].iloc[0])
 
-        # 1) Verifica se item já existe
-        existing = qdf("""
-            SELECT id, status FROM items WHERE serial_number = ? LIMIT 1;
-        """, (sn_to_use,))
-
-        if len(existing):
-            item_id = int(existing["id"].iloc[0])
-            item_status = str(existing["status"].iloc[0])
-
-            if item_status != "AVAILABLE":
-                st.error(f"Esse item já existe com status **{item_status}**. Para anexar, ele precisa estar **AVAILABLE**.")
-                st.stop()
-        else:
-            # 2) Cria item novo como AVAILABLE (depois vira IN_FIELD)
-            try:
-                item_id = insert_sql("""
-                    INSERT INTO items(serial_number, asset_tag, item_type_id, description, status, created_at)
-                    VALUES (?, ?, ?, ?, 'AVAILABLE', ?);
-                """, (
-                    sn_to_use,
-                    asset_tag.strip() or None,
-                    type_id,
-                    desc.strip() or None,
-                    datetime.utcnow().isoformat()
-                ))
-            except sqlite3.IntegrityError:
-                # corrida rara, reconsulta
-                existing2 = qdf("SELECT id, status FROM items WHERE serial_number = ? LIMIT 1;", (sn_to_use,))
-                if len(existing2) == 0:
-                    st.error("Erro ao criar item (integrity). Tente novamente.")
-                    st.stop()
-                item_id = int(existing2["id"].iloc[0])
-                if str(existing2["status"].iloc[0]) != "AVAILABLE":
-                    st.error(f"Item existe mas status não é AVAILABLE. Status atual: {existing2['status'].iloc[0]}")
-                    st.stop()
-
-        # 3) Cria assignment
-        insert_sql("""
-            INSERT INTO assignments(
-                item_id, technician_id, request_date, issued_date,
-                location_place_name, rdl, notes, closed, created_at
+        # Cadastra (se novo) + assignment + IN_FIELD numa única transação
+        try:
+            issue_serial(
+                get_pool(), sn_to_use, type_id, tech_id,
+                asset_tag=asset_tag.strip() or None,
+                description=desc.strip() or None,
+                request_date=to_iso(request_date),
+                issued_date=to_iso(issued_date),
+                location_place_name=location_place_name.strip() or None,
+                rdl=rdl.strip() or None,
+                notes=notes.strip() or None,
             )
-            VALUES (?, ?, ?, ?, ?, ?, ?, 0, ?);
-        """, (
-            item_id,
-            tech_id,
-            to_iso(request_date),
-            to_iso(issued_date),
-            location_place_name.strip() or None,
-            rdl.strip() or None,
-            notes.strip() or None,
-            datetime.utcnow().isoformat()
-        ))
-
-        # 4) Atualiza status do item -> IN_FIELD
-        exec_sql("UPDATE items SET status='IN_FIELD' WHERE id=?;", (item_id,))
+        except ItemNotAvailable as e:
+            st.error(f"Esse item já existe com status **{e.status}**. Para anexar, ele precisa estar **AVAILABLE**.")
+            st.stop()
 
         st.success(f"✅ Item **{sn_to_use}** anexado ao técnico **{tech_pick}** (status IN_FIELD).")
         st.session_state.qi_pending_clear = True
-        st.cache_data.clear()
         st.rerun()
 
     st.divider()
@@ -705,22 +716,11 @@ with tabs[4]:
 # =========================
 # TAB 5: Assignments
 # =========================
-with tabs[5]:
+if tab == TABS[5]:
     st.subheader("🔁 Assignments (Request → Issued → Installed → Returned)")
 
     techs = qdf("SELECT id, name FROM technicians WHERE active=1 ORDER BY name;")
-    items = qdf("""
-        SELECT
-            i.id,
-            it.name AS item_type,
-            i.serial_number,
-            COALESCE(i.asset_tag, '') AS asset_tag,
-            COALESCE(i.description, '') AS description,
-            i.status
-        FROM items i
-        JOIN item_types it ON it.id = i.item_type_id
-        ORDER BY it.name, i.serial_number;
-    """)
+    has_items = bool(qdf("SELECT EXISTS(SELECT 1 FROM items) AS n;")["n"].iloc[0])
 
     open_assign = qdf("""
         SELECT
@@ -746,7 +746,7 @@ with tabs[5]:
     """)
 
     st.markdown("### ➕ Create new Assignment (entregar/registrar item com técnico)")
-    if len(techs) == 0 or len(items) == 0:
+    if len(techs) == 0 or not has_items:
         st.warning("Cadastre technicians e items primeiro.")
     else:
         c1, c2, c3 = st.columns([1.2, 2.2, 1.1])
@@ -754,23 +754,45 @@ with tabs[5]:
             tech_pick = st.selectbox("Technician", techs["name"].tolist(), key="assign_tech_pick")
         with c2:
             filter_status = st.selectbox("Mostrar itens", ["AVAILABLE (recommended)", "ALL"], key="assign_filter_items")
-            items_filtered = items.copy()
-            if filter_status.startswith("AVAILABLE"):
-                items_filtered = items_filtered[items_filtered["status"] == "AVAILABLE"]
-
-            def item_label(r):
-                base = f"{r['item_type']} (SN: {r['serial_number']})"
-                tag = f" | {r['asset_tag']}" if (r["asset_tag"] or "").strip() else ""
-                desc = f" - {r['description']}" if (r["description"] or "").strip() else ""
-                return base + tag + desc
+            item_search = normalize_scan_text(st.text_input(
+                "Buscar item (início do SN ou Asset Tag)",
+                placeholder="Ex: SN0012 ou ORC-0",
+                key="assign_item_search"
+            ))
 
-            if len(items_filtered) == 0:
-                st.error("Sem itens AVAILABLE. Ajuste status ou feche assignments antigos.")
+            # Busca no banco (índices NOCASE) com LIMIT; o selectbox guarda o id do item
+            where, params = [], []
+            if item_search:
+                where.append("(i.serial_number LIKE ? ESCAPE '\\' OR i.asset_tag LIKE ? ESCAPE '\\')")
+                params += [like_prefix(item_search)] * 2
+            if filter_status.startswith("AVAILABLE"):
+                where.append("i.status = 'AVAILABLE'")
+            found = qdf(f"""
+                SELECT
+                    i.id,
+                    it.name AS item_type,
+                    i.serial_number,
+                    COALESCE(i.asset_tag, '') AS asset_tag,
+                    COALESCE(i.description, '') AS description,
+                    i.status
+                FROM items i
+                JOIN item_types it ON it.id = i.item_type_id
+                {"WHERE " + " AND ".join(where) if where else ""}
+                ORDER BY i.serial_number COLLATE NOCASE
+                LIMIT {ITEM_PICKER_LIMIT + 1};
+            """, params)
+
+            if len(found) == 0:
+                if item_search:
+                    st.error(f"Nenhum item encontrado para '{item_search}'.")
+                else:
+                    st.error("Sem itens AVAILABLE. Ajuste status ou feche assignments antigos.")
                 item_pick = None
             else:
-                items_filtered = items_filtered.copy()
-                items_filtered["label"] = items_filtered.apply(item_label, axis=1)
-                item_pick = st.selectbox("Item", items_filtered["label"].tolist(), key="assign_item_pick")
+                labels = {int(r["id"]): item_label(r) for r in found.head(ITEM_PICKER_LIMIT).to_dict("records")}
+                item_pick = st.selectbox("Item", list(labels), format_func=labels.get, key="assign_item_pick")
+                if len(found) > ITEM_PICKER_LIMIT:
+                    st.caption(f"Mostrando os primeiros {ITEM_PICKER_LIMIT}; digite mais do SN para refinar.")
 
         with c3:
             request_date = st.date_input("Request Date", value=date.today(), key="assign_req_date")
@@ -782,28 +804,22 @@ with tabs[5]:
 
         if st.button("Create Assignment", type="primary", disabled=(item_pick is None), key="btn_create_assignment"):
             tech_id = int(techs[techs["name"] == tech_pick]["id"].iloc[0])
-            item_id = int(items_filtered[items_filtered["label"] == item_pick]["id"].iloc[0])
+            item_id = int(item_pick)
 
-            insert_sql("""
-                INSERT INTO assignments(
-                    item_id, technician_id, request_date, issued_date,
-                    location_place_name, rdl, notes, closed, created_at
+            try:
+                issue_item(
+                    get_pool(), item_id, tech_id,
+                    request_date=to_iso(request_date),
+                    issued_date=to_iso(issued_date),
+                    location_place_name=location_place_name.strip() or None,
+                    rdl=rdl.strip() or None,
+                    notes=notes.strip() or None,
+                    require_available=filter_status.startswith("AVAILABLE"),
                 )
-                VALUES (?, ?, ?, ?, ?, ?, ?, 0, ?);
-            """, (
-                item_id,
-                tech_id,
-                to_iso(request_date),
-                to_iso(issued_date),
-                location_place_name.strip() or None,
-                rdl.strip() or None,
-                notes.strip() or None,
-                datetime.utcnow().isoformat()
-            ))
-
-            exec_sql("UPDATE items SET status='IN_FIELD' WHERE id=?;", (item_id,))
+            except ItemNotAvailable as e:
+                st.error(f"Item {e.serial_number} não está mais AVAILABLE (status atual: {e.status}).")
+                st.stop()
             st.success("Assignment criado. Item agora está IN_FIELD.")
-            st.cache_data.clear()
             st.rerun()
 
     st.divider()
@@ -864,60 +880,87 @@ with tabs[5]:
         )
 
         if st.button("Save Update", key="btn_assign_save_update"):
-            exec_sql("""
-                UPDATE assignments
-                SET installed_date=?, location_place_name=?, rdl=?, notes=?
-                WHERE id=?;
-            """, (
-                to_iso(new_installed) if mark_installed else None,
-                new_place.strip() or None,
-                new_rdl.strip() or None,
-                new_notes.strip() or None,
-                int(pick_id)
-            ))
+            if mark_lost:
+                outcome = "LOST"
+            elif mark_damaged:
+                outcome = "DAMAGED"
+            elif mark_returned:
+                outcome = "RETURNED"
+            elif mark_installed:
+                outcome = "INSTALLED"
+            else:
+                outcome = None
 
-            item_id = int(qdf("SELECT item_id FROM assignments WHERE id=?;", (int(pick_id),))["item_id"].iloc[0])
+            try:
+                update_assignment(
+                    get_pool(), int(pick_id),
+                    installed_date=to_iso(new_installed) if mark_installed else None,
+                    location_place_name=new_place.strip() or None,
+                    rdl=new_rdl.strip() or None,
+                    notes=new_notes.strip() or None,
+                    outcome=outcome,
+                    closed_date=to_iso(date.today()),
+                )
+            except AssignmentClosed:
+                st.error("Esse assignment já foi fechado (outra sessão). Recarregue a lista.")
+                st.stop()
 
-            if mark_lost:
-                exec_sql("UPDATE items SET status='LOST' WHERE id=?;", (item_id,))
-                exec_sql("UPDATE assignments SET closed=1, returned_date=? WHERE id=?;", (to_iso(date.today()), int(pick_id)))
+            if outcome == "LOST":
                 st.success("Item marcado como LOST e assignment fechado.")
-            elif mark_damaged:
-                exec_sql("UPDATE items SET status='DAMAGED' WHERE id=?;", (item_id,))
-                exec_sql("UPDATE assignments SET closed=1, returned_date=? WHERE id=?;", (to_iso(date.today()), int(pick_id)))
+            elif outcome == "DAMAGED":
                 st.success("Item marcado como DAMAGED e assignment fechado.")
-            elif mark_returned:
-                exec_sql("UPDATE items SET status='AVAILABLE' WHERE id=?;", (item_id,))
-                exec_sql("UPDATE assignments SET closed=1, returned_date=? WHERE id=?;", (to_iso(date.today()), int(pick_id)))
+            elif outcome == "RETURNED":
                 st.success("Assignment fechado. Item voltou para AVAILABLE.")
-            elif mark_installed:
-                exec_sql("UPDATE items SET status='INSTALLED' WHERE id=?;", (item_id,))
+            elif outcome == "INSTALLED":
                 st.success("Atualizado. Item marcado como INSTALLED (assignment continua aberto).")
             else:
                 st.success("Atualizado. (Somente campos do assignment foram editados; status do item mantido.)")
 
-            st.cache_data.clear()
             st.rerun()
 
 # =========================
 # TAB 6: Export
 # =========================
-with tabs[6]:
+if tab == TABS[6]:
     st.subheader("📤 Export / Reports")
+    st.caption("O arquivo só é gerado quando você clica em baixar, direto do banco em blocos (sem carregar tudo na memória).")
+
+    e1, e2, e3 = st.columns([1, 1, 2])
+    with e1:
+        export_name = st.selectbox("Dados", list(EXPORTS), format_func=str.capitalize, key="export_name")
+    with e2:
+        export_fmt = st.selectbox("Formato", list(EXPORT_FORMATS), format_func=str.upper, key="export_fmt")
+    with e3:
+        export_status = st.multiselect(
+            "Status do item (vazio = todos)",
+            ["AVAILABLE", "IN_FIELD", "INSTALLED", "LOST", "DAMAGED"],
+            key="export_status"
+        )
 
-    df_items = qdf("""
-        SELECT
-            i.id,
-            it.name AS item_type,
-            i.serial_number,
-            i.asset_tag,
-            i.description,
-            i.status,
-            i.created_at
-        FROM items i
-        JOIN item_types it ON it.id = i.item_type_id;
-    """)
-    df_assign = qdf("""
+    use_dates = st.checkbox("Filtrar por data (items: cadastro · assignments: issued/request)", key="export_use_dates")
+    date_from = date_to = None
+    if use_dates:
+        d1, d2 = st.columns(2)
+        with d1:
+            date_from = to_iso(st.date_input("De", value=date.today().replace(day=1), key="export_from"))
+        with d2:
+            date_to = to_iso(st.date_input("Até", value=date.today(), key="export_to"))
+
+    export_sql, export_params = export_query(export_name, date_from, date_to, export_status)
+    n_rows = int(qdf(f"SELECT count(*) AS n FROM ({export_sql});", export_params)["n"].iloc[0])
+    st.caption(f"{n_rows} linha(s) no export.")
+
+    st.download_button(
+        f"⬇️ Export {export_name.capitalize()} {export_fmt.upper()}",
+        data=partial(export_file, get_pool(), export_sql, export_params, export_fmt, sheet=export_name),
+        file_name=f"{export_name}_{today_str()}.{export_fmt}",
+        mime=EXPORT_FORMATS[export_fmt],
+        disabled=n_rows == 0,
+        key="dl_export"
+    )
+
+    st.markdown("### Últimos 200 assignments")
+    preview = qdf("""
         SELECT
             a.id AS assignment_id,
             t.name AS technician,
@@ -937,28 +980,146 @@ with tabs[6]:
         FROM assignments a
         JOIN technicians t ON t.id = a.technician_id
         JOIN items i ON i.id = a.item_id
-        JOIN item_types it ON it.id = i.item_type_id;
+        JOIN item_types it ON it.id = i.item_type_id
+        ORDER BY a.created_at DESC
+        LIMIT 200;
     """)
+    if len(preview):
+        preview["status"] = preview["status"].map(status_badge)
+    st.dataframe(preview, use_container_width=True, hide_index=True)
 
-    c1, c2 = st.columns(2)
-    with c1:
-        st.download_button(
-            "⬇️ Export Items CSV",
-            data=df_items.to_csv(index=False).encode("utf-8"),
-            file_name=f"items_{today_str()}.csv",
-            mime="text/csv",
-            key="dl_items"
-        )
-    with c2:
-        st.download_button(
-            "⬇️ Export Assignments CSV",
-            data=df_assign.to_csv(index=False).encode("utf-8"),
-            file_name=f"assignments_{today_str()}.csv",
-            mime="text/csv",
-            key="dl_assign"
+# =========================
+# TAB 7: Import (CSV/XLSX)
+# =========================
+if tab == TABS[7]:
+    st.subheader("📥 Import (CSV / XLSX)")
+    st.caption(
+        "Colunas reconhecidas: serial_number (SN), item_type, asset_tag, description, status, technician, "
+        "request_date, issued_date, installed_date, returned_date, place_name, rdl, notes. "
+        "Linhas com technician viram assignments; SNs que já existem no banco são ignorados e listados como conflito."
+    )
+    st.caption("Para arquivos muito grandes use a linha de comando: `python -m utils.inventory_import arquivo.xlsx`")
+
+    upload = st.file_uploader("Arquivo", type=["csv", "xlsx"], key="imp_file")
+    create_missing = st.checkbox("Criar Item Types / Technicians que não existem", value=True, key="imp_create_missing")
+    date_label = st.selectbox(
+        "Formato das datas em texto", list(DATE_FORMATS), key="imp_date_format",
+        help="Vale para o arquivo inteiro; datas em outro formato viram conflito (datas ISO são sempre aceitas).",
+    )
+
+    if st.button("📥 Importar", type="primary", disabled=upload is None, key="btn_import"):
+        try:
+            with st.spinner("Importando..."):
+                report = import_records(get_pool(), upload, filename=upload.name, create_missing=create_missing,
+                                        date_format=DATE_FORMATS[date_label])
+            st.session_state.imp_report = report
+        except ValueError as e:
+            st.error(str(e))
+
+    report = st.session_state.get("imp_report")
+    if report:
+        st.success(
+            f"✅ {report['rows']} linhas → {report['items']} items, {report['assignments']} assignments "
+            f"({report['types_created']} types e {report['technicians_created']} technicians criados) em {report['seconds']}s."
         )
+        if report["superseded"]:
+            st.info(f"{report['superseded']} assignment(s) fechados por uma linha posterior do mesmo serial.")
+        if report["conflicts"]:
+            conflicts = pd.DataFrame(report["conflicts"])
+            st.warning(f"{len(conflicts)} linha(s) com conflito não foram importadas.")
+            st.dataframe(conflicts.head(1000), use_container_width=True, hide_index=True)
+            st.download_button(
+                "⬇️ Baixar relatório de conflitos",
+                data=conflicts.to_csv(index=False).encode("utf-8"),
+                file_name=f"import_conflicts_{today_str()}.csv",
+                mime="text/csv",
+                key="dl_import_conflicts"
+            )
 
-    df_show = df_assign.copy()
-    if len(df_show):
-        df_show["status"] = df_show["status"].apply(status_badge)
-    st.dataframe(df_show.sort_values("created_at", ascending=False), use_container_width=True, hide_index=True)
+# =========================
+# TAB 8: Search (FTS5)
+# =========================
+SEARCH_PAGE_SIZE = 25
+
+if tab == TABS[8]:
+    st.subheader("🔎 Search (SN, asset tag, descrição, place, RDL, notes)")
+
+    search_text = st.text_input(
+        "Buscar",
+        placeholder='Ex: "Shoppers Markham", "RDL-12", início do SN',
+        key="search_text"
+    )
+    match = fts_query(search_text)
+
+    if st.session_state.get("search_last") != match:
+        st.session_state.search_last = match
+        st.session_state.search_page = 0
+
+    if not match:
+        st.info("Digite uma ou mais palavras. Cada palavra é buscada como prefixo (todas precisam aparecer).")
+    else:
+        # inventory_fts entra na chave de cache como items + assignments (ver tables_in)
+        total = int(qdf(
+            "SELECT count(*) AS n FROM inventory_fts WHERE inventory_fts MATCH ?;", (match,)
+        )["n"].iloc[0])
+        pages = max(1, -(-total // SEARCH_PAGE_SIZE))
+        page = min(st.session_state.search_page, pages - 1)
+
+        # Ranking bm25 + paginação no SQLite; só a página atual vira DataFrame
+        hits = qdf("""
+            WITH hits AS (
+                SELECT
+                    rowid,
+                    rank,
+                    snippet(inventory_fts, -1, '**', '**', '…', 8) AS match
+                FROM inventory_fts
+                WHERE inventory_fts MATCH ?
+                ORDER BY rank
+                LIMIT ? OFFSET ?
+            )
+            SELECT
+                CASE WHEN h.rowid % 2 = 0 THEN 'item' ELSE 'assignment' END AS kind,
+                i.serial_number,
+                it.name AS item_type,
+                i.asset_tag,
+                i.status,
+                t.name AS technician,
+                a.issued_date,
+                a.returned_date,
+                a.location_place_name,
+                a.rdl,
+                h.match
+            FROM hits h
+            LEFT JOIN assignments a ON h.rowid % 2 = 1 AND a.id = h.rowid / 2
+            JOIN items i ON i.id = CASE WHEN h.rowid % 2 = 0 THEN h.rowid / 2 ELSE a.item_id END
+            JOIN item_types it ON it.id = i.item_type_id
+            LEFT JOIN technicians t ON t.id = a.technician_id
+            ORDER BY h.rank;
+        """, (match, SEARCH_PAGE_SIZE, page * SEARCH_PAGE_SIZE))
+
+        if total == 0:
+            st.info("Nada encontrado.")
+        else:
+            hits["status"] = hits["status"].map(status_badge)
+            st.caption(f"{total} resultado(s) · página {page + 1} de {pages}")
+            st.dataframe(
+                hits,
+                use_container_width=True,
+                hide_index=True,
+                column_config={
+                    "kind": "Tipo de registro",
+                    "serial_number": "Serial Number",
+                    "item_type": "Tipo",
+                    "match": "Trecho"
+                }
+            )
+
+            p1, p2, _ = st.columns([1, 1, 4])
+            with p1:
+                if st.button("⬅️ Anterior", disabled=page == 0, key="btn_search_prev"):
+                    st.session_state.search_page = page - 1
+                    st.rerun()
+            with p2:
+                if st.button("Próxima ➡️", disabled=page >= pages - 1, key="btn_search_next"):
+                    st.session_state.search_page = page + 1
+                    st.rerun()
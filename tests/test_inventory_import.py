@@ -0,0 +1,71 @@
+import io
+
+import pytest
+
+from utils.inventory_db import ConnectionPool, init_db
+from utils.inventory_import import import_records
+
+HISTORY_CSV = """serial_number,item_type,technician,status,issued_date,returned_date
+SN1,Router,Ana,,2025-01-01,
+SN1,,Bruno,,2025-02-01,
+SN2,Router,Ana,,2025-01-01,2025-01-20
+SN1,,Carla,,2025-03-01,
+SN3,Sign,Ana,,2025-01-05,
+SN2,,Bruno,,2025-02-01,
+SN3,,,AVAILABLE,,
+SN4,Sign,Ana,,2025-13-01,
+"""
+
+
+def _import(tmp_path, name, text, **kwargs):
+    pool = ConnectionPool(str(tmp_path / f"{name}.db"))
+    init_db(pool)
+    report = import_records(pool, io.StringIO(text), filename=f"{name}.csv", **kwargs)
+    conn = pool.connection()
+    items = conn.execute("SELECT serial_number, status FROM items ORDER BY serial_number;").fetchall()
+    assignments = conn.execute("""
+        SELECT i.serial_number, t.name, a.issued_date, a.closed
+        FROM assignments a
+        JOIN items i ON i.id = a.item_id
+        JOIN technicians t ON t.id = a.technician_id
+        ORDER BY a.id;
+    """).fetchall()
+    pool.close_all()
+    report.pop("seconds")
+    return report, items, assignments
+
+
+def test_result_does_not_depend_on_chunk_size(tmp_path):
+    one = _import(tmp_path, "one", HISTORY_CSV, chunk_rows=1)
+    hundred = _import(tmp_path, "hundred", HISTORY_CSV, chunk_rows=100)
+    assert one == hundred
+
+    report, items, assignments = hundred
+    assert report["items"] == 3 and report["assignments"] == 6
+    assert [c["serial_number"] for c in report["conflicts"]] == ["SN4"]
+    assert items == [("SN1", "IN_FIELD"), ("SN2", "IN_FIELD"), ("SN3", "AVAILABLE")]
+
+
+def test_only_the_last_assignment_stays_open(tmp_path):
+    report, _, assignments = _import(tmp_path, "history", HISTORY_CSV, chunk_rows=2)
+    open_rows = [(sn, tech) for sn, tech, _, closed in assignments if not closed]
+    # SN3's last row returns it without a technician: its assignment is closed too
+    assert open_rows == [("SN1", "Carla"), ("SN2", "Bruno")]
+    assert report["superseded"] == 3  # SN1 Ana, SN1 Bruno, SN3 Ana (SN2 Ana was already returned)
+
+
+@pytest.mark.parametrize("date_format, expected", [
+    (None, None),
+    ("%d/%m/%Y", ["2025-02-01", "2025-02-13"]),
+    ("%m/%d/%Y", None),
+])
+def test_text_dates_use_one_format_for_the_whole_file(tmp_path, date_format, expected):
+    text = "serial_number,item_type,technician,issued_date\nD1,Router,Ana,01/02/2025\nD2,Router,Ana,13/02/2025\n"
+    report, _, assignments = _import(tmp_path, "dates", text, date_format=date_format)
+    if expected is None:
+        # never guessed: without a matching format the row is reported, not imported
+        assert len(report["conflicts"]) >= 1
+        assert all("invalid date in issued_date" in c["reason"] for c in report["conflicts"])
+    else:
+        assert [a[2] for a in assignments] == expected
+        assert not report["conflicts"]
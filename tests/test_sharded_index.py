@@ -0,0 +1,39 @@
+from langchain_core.documents import Document
+
+from utils.embeddings import HashingEmbeddings
+from utils.sharded_index import ShardedIndex
+
+
+def _index():
+    index = ShardedIndex(embeddings=HashingEmbeddings(dim=64))
+    index.add_documents([
+        Document(page_content="Mount the bracket on the pole.", metadata={"source": "installation/a.md"}),
+        Document(page_content="Flashing red LED means no signal.", metadata={"source": "troubleshooting/b.md"}),
+        Document(page_content="Sign out every box.", metadata={"source": "inventory/c.md"}),
+        Document(page_content="Move the kiosk.", metadata={"source": "SST/d.md"}),
+        Document(page_content="Kiosk photo", metadata={"source": "images/SST Relocation/e.jpg", "type": "image"}),
+    ])
+    return index
+
+
+def test_alias_queries_reach_their_shard():
+    index = _index()
+    assert index.route("how high do I mount it") == ["installation"]
+    assert index.route("transceiver is flashing") == ["troubleshooting"]
+    assert index.route("steps to sign out a unit") == ["inventory"]
+    assert index.route("relocating a kiosk") == ["sst"]
+    assert index.route("SST") == ["sst"]
+
+
+def test_unmatched_query_searches_every_category():
+    index = _index()
+    assert index.route("carmanah") == index.categories == ["installation", "inventory", "sst", "troubleshooting"]
+
+
+def test_router_follows_live_updates():
+    index = _index()
+    assert index.route("calibration") == index.categories
+    index.apply_update(set(), [Document(page_content="Calibrate the sensor.", metadata={"source": "calibration/f.md"})])
+    assert index.route("calibration steps") == ["calibration"]
+    index.apply_update({"installation/a.md"}, [])
+    assert "installation" not in index.route("mount")
@@ -0,0 +1,89 @@
+from typing import Callable, List
+
+import streamlit as st
+
+WINDOW_TURNS = 4             # turns rendered by default (1 turn = user + assistant)
+MAX_LIVE_MESSAGES = 20       # older messages are compacted into the summary + archive
+ARCHIVE_LIMIT = 200          # oldest archived messages are dropped beyond this
+SUMMARY_MAX_CHARS = 1500
+CONTEXT_MESSAGES = 5
+CONTEXT_MESSAGE_CHARS = 800
+
+
+def init_history(state):
+    """Session keys: messages (live), history_archive, history_summary, history_pages."""
+    for key, default in {
+        "messages": [],
+        "history_archive": [],
+        "history_summary": "",
+        "history_pages": 0,
+    }.items():
+        if key not in state:
+            state[key] = default
+
+
+def clear_history(state):
+    state.messages = []
+    state.history_archive = []
+    state.history_summary = ""
+    state.history_pages = 0
+
+
+def _summary_line(msg: dict) -> str:
+    text = " ".join((msg.get("content") or "").split())
+    if msg["role"] == "assistant":
+        text = text[:160]  # first sentence(s) of the answer are enough to keep the thread
+    else:
+        text = text[:200]
+    return f"{msg['role']}: {text}"
+
+
+def append_message(state, msg: dict):
+    """Appends to the live history and compacts the oldest messages once it exceeds MAX_LIVE_MESSAGES."""
+    state.messages.append(msg)
+
+    overflow = len(state.messages) - MAX_LIVE_MESSAGES
+    if overflow <= 0:
+        return
+
+    old, state.messages = state.messages[:overflow], state.messages[overflow:]
+    state.history_archive = (state.history_archive + old)[-ARCHIVE_LIMIT:]
+
+    # Rolling, extractive summary (no LLM call): newest lines win when it gets too long
+    lines = [l for l in state.history_summary.split("\n") if l] + [_summary_line(m) for m in old]
+    while lines and len("\n".join(lines)) > SUMMARY_MAX_CHARS:
+        lines.pop(0)
+    state.history_summary = "\n".join(lines)
+
+
+def history_context(state, last_n: int = CONTEXT_MESSAGES) -> str:
+    """Prompt history of bounded size: rolling summary of older turns + the last messages."""
+    recent = "\n".join(
+        f"{m['role']}: {(m.get('content') or '')[:CONTEXT_MESSAGE_CHARS]}"
+        for m in state.messages[-last_n:]
+    )
+    if state.history_summary:
+        return f"Summary of earlier conversation:\n{state.history_summary}\n\nRecent messages:\n{recent}"
+    return recent
+
+
+def render_history(state, render_message: Callable[[dict, bool], None], window_turns: int = WINDOW_TURNS):
+    """
+    Renders only the last window_turns turns. Older messages stay collapsed behind
+    a "load earlier" button and are only materialised (compact=True) when requested.
+    """
+    all_messages: List[dict] = state.history_archive + state.messages
+    shown = window_turns * 2 * (1 + state.history_pages)
+    hidden = max(0, len(all_messages) - shown)
+
+    if hidden:
+        if st.button(f"⬆️ Load earlier messages ({hidden})", key=f"history_load_{state.history_pages}"):
+            state.history_pages += 1
+            st.rerun()
+    elif state.history_pages and st.button("⬇️ Show recent only", key="history_collapse"):
+        state.history_pages = 0
+        st.rerun()
+
+    recent_start = max(0, len(all_messages) - window_turns * 2)
+    for i, msg in enumerate(all_messages[hidden:], start=hidden):
+        render_message(msg, i < recent_start)
@@ -0,0 +1,72 @@
+import re
+from typing import Dict, Iterable, List, Optional
+
+# "Componente – {json com "pkey": "..."}"
+COMPONENT_LINE_RE = re.compile(r'^([A-Za-z\s]+\s*\d*)\s*[–\-:]\s*(.+)$')
+PKEY_RE = re.compile(r'"pkey"\s*:\s*"([^"]+)"')
+
+
+def extract_components_with_serials(text: str) -> List[dict]:
+    """Extrai componentes e seus respectivos números de série"""
+    components = []
+
+    for line in text.split('\n'):
+        line = line.strip()
+        if not line:
+            continue
+
+        component_match = COMPONENT_LINE_RE.match(line)
+        if component_match:
+            component_name = component_match.group(1).strip()
+            json_part = component_match.group(2).strip()
+
+            pkey_match = PKEY_RE.search(json_part)
+            if pkey_match:
+                components.append({
+                    "component": component_name,
+                    "serial": pkey_match.group(1),
+                    "json_data": json_part,
+                    "scanned": False  # Flag para controlar se já foi escaneado
+                })
+
+    return components
+
+
+class ComponentRegistry:
+    """
+    Components and serials extracted from the documents at index-build time,
+    keyed by (document, component). O(1) lookup by serial and by component name.
+    """
+
+    def __init__(self):
+        self.entries: Dict[tuple, dict] = {}
+        self.by_serial: Dict[str, dict] = {}
+        self.by_name: Dict[str, List[dict]] = {}
+
+    def __len__(self):
+        return len(self.entries)
+
+    def add(self, source: str, components: Iterable[dict]):
+        for comp in components:
+            entry = {**comp, "source": source}
+            key = (source, comp["component"])
+            if key in self.entries:
+                continue
+            self.entries[key] = entry
+            self.by_serial.setdefault(comp["serial"], entry)
+            self.by_name.setdefault(comp["component"].lower(), []).append(entry)
+
+    def add_text(self, source: str, text: str) -> List[dict]:
+        components = extract_components_with_serials(text)
+        self.add(source, components)
+        return components
+
+    def find_serial(self, serial: str) -> Optional[dict]:
+        return self.by_serial.get((serial or "").strip())
+
+    def find_component(self, name: str) -> List[dict]:
+        return self.by_name.get((name or "").strip().lower(), [])
+
+    def unique_components(self) -> List[dict]:
+        """One entry per component name, in document order (the scan checklist)."""
+        return [entries[0] for entries in self.by_name.values()]
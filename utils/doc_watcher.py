@@ -0,0 +1,127 @@
+import os
+import threading
+import time
+from typing import Callable, Dict, Optional, Set, Tuple
+
+from utils.knowledge_base import DOC_DIR, INDEXED_EXTENSIONS, update_index
+from utils.sharded_index import ShardedIndex
+
+POLL_INTERVAL = 1.0   # seconds between directory scans
+DEBOUNCE = 2.0        # quiet period before a burst of changes is applied (copies, editor saves)
+
+_watchers = []
+_watchers_lock = threading.Lock()  # start/stop come from several Streamlit sessions
+
+
+class DocumentWatcher(threading.Thread):
+    """
+    Polls doc_dir (stat only, no hashing) in a daemon thread and calls on_change
+    with the changed relative paths once no further change was seen for
+    `debounce` seconds. Polling works the same on Linux, Windows and network
+    folders, where inotify-style events are not always available.
+    With sync_on_start, on_change(None) runs first (full diff), so changes made
+    while no watcher was running are not missed.
+    """
+
+    def __init__(self, on_change: Callable[[Optional[Set[str]]], Optional[dict]], doc_dir: str = DOC_DIR,
+                 interval: float = POLL_INTERVAL, debounce: float = DEBOUNCE, sync_on_start: bool = True):
+        super().__init__(daemon=True, name="document-watcher")
+        self.on_change = on_change
+        self.doc_dir = doc_dir
+        self.interval = interval
+        self.debounce = debounce
+        self.sync_on_start = sync_on_start
+        self.index: Optional[ShardedIndex] = None  # what watch_index feeds, to reuse the watcher
+        self.last_result: Optional[dict] = None
+        self.last_error: Optional[str] = None
+        self.updates = 0
+        self._stop_event = threading.Event()
+
+    def _snapshot(self) -> Dict[str, Tuple[int, int]]:
+        files = {}
+        for root, _, names in os.walk(self.doc_dir):
+            for name in names:
+                if name.lower().endswith(INDEXED_EXTENSIONS):
+                    path = os.path.join(root, name)
+                    try:
+                        stat = os.stat(path)
+                    except OSError:
+                        continue  # deleted between walk and stat
+                    files[os.path.relpath(path, self.doc_dir)] = (stat.st_mtime_ns, stat.st_size)
+        return files
+
+    def _apply(self, changed: Optional[Set[str]]):
+        try:
+            self.last_result = self.on_change(changed)
+            self.last_error = None
+            self.updates += 1
+        except Exception as e:
+            self.last_error = f"{type(e).__name__}: {e}"
+            print(f"Document watcher: update failed: {self.last_error}")
+
+    def run(self):
+        previous = self._snapshot()  # taken before the sync: later edits show up in the diff below
+        if self.sync_on_start:
+            self._apply(None)
+        pending: Set[str] = set()
+        last_change = 0.0
+
+        while not self._stop_event.wait(self.interval):
+            current = self._snapshot()
+            diff = {p for p in previous.keys() | current.keys() if previous.get(p) != current.get(p)}
+            previous = current
+            if diff:
+                pending |= diff
+                last_change = time.monotonic()
+                continue
+
+            if pending and time.monotonic() - last_change >= self.debounce:
+                changed, pending = pending, set()
+                self._apply(changed)
+
+    @property
+    def stopped(self) -> bool:
+        return self._stop_event.is_set()
+
+    def stop(self):
+        self._stop_event.set()
+
+
+def watch_index(index: ShardedIndex, folder: Optional[str] = None, doc_dir: str = DOC_DIR,
+                client=None, include_images: bool = True, **kwargs) -> DocumentWatcher:
+    """
+    Starts a watcher that feeds the changed paths under doc_dir into
+    update_index(index), or returns the one already watching index.
+    """
+
+    def on_change(paths: Optional[Set[str]]) -> dict:
+        t0 = time.perf_counter()
+        result = update_index(index, doc_dir, folder=folder, client=client, include_images=include_images,
+                              paths=paths)
+        if result:
+            result["seconds"] = round(time.perf_counter() - t0, 2)
+            print(f"Document watcher: {len(result['changed'])} changed, {len(result['removed'])} removed "
+                  f"-> index {result['version']} in {result['seconds']}s")
+        return result or {"changed": [], "removed": [], "paths": sorted(paths or ())}
+
+    with _watchers_lock:
+        watcher = running_watcher()
+        if watcher and watcher.index is index:
+            return watcher
+        watcher = DocumentWatcher(on_change, doc_dir, **kwargs)
+        watcher.index = index
+        watcher.start()
+        _watchers.append(watcher)
+        return watcher
+
+
+def running_watcher() -> Optional[DocumentWatcher]:
+    """The live watcher started by watch_index, if any (shared by every session of the process)."""
+    return next((w for w in reversed(_watchers) if w.is_alive() and not w.stopped), None)
+
+
+def stop_watchers():
+    """Stops every watcher started by watch_index (e.g. before the index is rebuilt from scratch)."""
+    with _watchers_lock:
+        while _watchers:
+            _watchers.pop().stop()
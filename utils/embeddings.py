@@ -0,0 +1,125 @@
+import hashlib
+import json
+import math
+import os
+import zlib
+from collections import Counter
+from typing import List, Optional
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from utils.lexical_index import tokenize
+from utils.tracing import TracedEmbeddings
+
+EMBEDDING_BACKENDS = ("openai", "local")
+DEFAULT_BACKEND = "openai"
+OPENAI_EMBEDDING_MODEL = "text-embedding-3-small"
+LOCAL_EMBEDDING_DIM = 1024
+
+
+class HashingEmbeddings(Embeddings):
+    """
+    Offline embedding backend: hashed bag of words + word bigrams, sublinear TF,
+    L2-normalised (so FAISS L2 distance ranks like cosine similarity).
+
+    Stateless on purpose: no vocabulary or IDF to fit, so vectors stay comparable
+    across rebuilds and incremental updates. No network, NumPy only.
+    """
+
+    def __init__(self, dim: int = LOCAL_EMBEDDING_DIM, bigrams: bool = True):
+        self.dim = dim
+        self.bigrams = bigrams
+
+    def _features(self, text: str) -> Counter:
+        tokens = tokenize(text)
+        feats = Counter(tokens)
+        if self.bigrams:
+            feats.update(f"{a} {b}" for a, b in zip(tokens, tokens[1:]))
+        return feats
+
+    def _embed(self, text: str) -> List[float]:
+        vec = np.zeros(self.dim, dtype=np.float32)
+        for feat, tf in self._features(text).items():
+            h = zlib.crc32(feat.encode("utf-8"))
+            sign = 1.0 if (h >> 31) & 1 else -1.0
+            vec[h % self.dim] += sign * (1.0 + math.log(tf))
+        norm = np.linalg.norm(vec)
+        if norm > 0:
+            vec /= norm
+        return vec.tolist()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return [self._embed(t) for t in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._embed(text)
+
+
+def resolve_backend(backend: Optional[str] = None) -> str:
+    """Explicit value > EMBEDDING_BACKEND env var > default ('openai')."""
+    name = (backend or os.environ.get("EMBEDDING_BACKEND") or DEFAULT_BACKEND).strip().lower()
+    if name not in EMBEDDING_BACKENDS:
+        raise ValueError(f"Unknown embedding backend '{name}'. Use one of: {', '.join(EMBEDDING_BACKENDS)}")
+    return name
+
+
+def get_embeddings(backend: Optional[str] = None) -> Embeddings:
+    """Returns the LangChain Embeddings object for the configured backend (query time is traced)."""
+    name = resolve_backend(backend)
+    if name == "local":
+        return TracedEmbeddings(HashingEmbeddings())
+
+    from langchain_openai import OpenAIEmbeddings
+    return TracedEmbeddings(OpenAIEmbeddings(model=OPENAI_EMBEDDING_MODEL))
+
+
+def backend_signature(backend: Optional[str] = None) -> str:
+    """Identifies the vector space; indexes built with another signature can't be queried."""
+    name = resolve_backend(backend)
+    if name == "local":
+        return f"local-hashing-{LOCAL_EMBEDDING_DIM}"
+    return f"openai-{OPENAI_EMBEDDING_MODEL}"
+
+
+class RecordedEmbeddings(Embeddings):
+    """
+    Replays vectors recorded in a JSON file (keyed by SHA-1 of the text), so a
+    benchmark can be rerun offline against a paid backend's vector space.
+    With record=True, misses are computed by `inner` and added; call save() afterwards.
+    """
+
+    def __init__(self, path: str, inner: Optional[Embeddings] = None, record: bool = False):
+        self.path = path
+        self.inner = inner
+        self.record = record
+        self.vectors = {}
+        self.misses = 0
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                self.vectors = json.load(f).get("vectors", {})
+
+    @staticmethod
+    def _key(text: str) -> str:
+        return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+    def _lookup(self, texts: List[str], embed) -> List[List[float]]:
+        keys = [self._key(t) for t in texts]
+        missing = [i for i, k in enumerate(keys) if k not in self.vectors]
+        if missing:
+            if not (self.record and self.inner):
+                raise KeyError(f"{len(missing)} text(s) not recorded in {self.path}; rerun with recording enabled")
+            self.misses += len(missing)
+            for i, vec in zip(missing, embed([texts[i] for i in missing])):
+                self.vectors[keys[i]] = vec
+        return [self.vectors[k] for k in keys]
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self._lookup(texts, lambda batch: self.inner.embed_documents(batch))
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._lookup([text], lambda batch: [self.inner.embed_query(t) for t in batch])[0]
+
+    def save(self):
+        with open(self.path, "w", encoding="utf-8") as f:
+            json.dump({"vectors": self.vectors}, f)
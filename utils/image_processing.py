@@ -1,6 +1,28 @@
 import base64
+import json
+import math
 import os
+from functools import lru_cache
+from io import BytesIO
+from typing import Dict, List, Optional
+
 from openai import OpenAI
+from PIL import Image, ImageOps, features
+
+DERIVATIVE_DIR = os.path.join(".cache", "image_derivatives")
+DISPLAY_WIDTH = 450
+THUMBNAIL_WIDTH = 160
+DERIVATIVE_WIDTHS = (DISPLAY_WIDTH, THUMBNAIL_WIDTH)
+
+DESCRIBE_PROMPT = (
+    "Describe this technical image detailedly for retrieval purposes. "
+    "Include any visible text, error codes, component names, and the state of LEDs or displays. "
+    "Be concise."
+)
+DESCRIPTION_MAX_TOKENS = 300
+BATCH_INPUT_TOKENS = 6000   # estimated image input tokens per batched request
+BATCH_MAX_IMAGES = 8
+
 
 def encode_image(image_path):
     """Encodes an image to base64."""
@@ -22,11 +44,7 @@ def describe_image(client: OpenAI, image_path: str) -> str:
                 "content": [
                     {
                         "type": "text",
-                        "text": (
-                            "Describe this technical image detailedly for retrieval purposes. "
-                            "Include any visible text, error codes, component names, and the state of LEDs or displays. "
-                            "Be concise."
-                        )
+                        "text": DESCRIBE_PROMPT
                     },
                     {
                         "type": "image_url",
@@ -37,7 +55,186 @@ def describe_image(client: OpenAI, image_path: str) -> str:
                 ]
             }
         ],
-        max_tokens=300
+        max_tokens=DESCRIPTION_MAX_TOKENS
     )
     
     return response.choices[0].message.content
+
+
+# ================= BATCHED DESCRIPTIONS =================
+def estimate_image_tokens(image_path: str) -> int:
+    """
+    Vision input tokens for a high-detail image: scaled to fit 2048x2048, then
+    shortest side to 768, 170 tokens per 512px tile + 85.
+    """
+    try:
+        with Image.open(image_path) as img:
+            w, h = img.size
+    except Exception:
+        return 765  # a typical 1024x768 photo
+    scale = min(1.0, 2048 / max(w, h))
+    w, h = w * scale, h * scale
+    scale = min(1.0, 768 / min(w, h))
+    w, h = w * scale, h * scale
+    return 85 + 170 * math.ceil(w / 512) * math.ceil(h / 512)
+
+
+def plan_batches(image_paths: List[str], token_budget: int = BATCH_INPUT_TOKENS,
+                 max_images: int = BATCH_MAX_IMAGES) -> List[List[str]]:
+    """Greedy packing of images into requests that stay under token_budget (at least one image each)."""
+    batches, current, used = [], [], 0
+    for path in image_paths:
+        cost = estimate_image_tokens(path)
+        if current and (used + cost > token_budget or len(current) >= max_images):
+            batches.append(current)
+            current, used = [], 0
+        current.append(path)
+        used += cost
+    if current:
+        batches.append(current)
+    return batches
+
+
+def _mime_type(image_path: str) -> str:
+    return "image/png" if image_path.lower().endswith(".png") else "image/jpeg"
+
+
+def _describe_batch(client: OpenAI, image_paths: List[str]) -> Dict[str, str]:
+    """One request for several images; returns only the descriptions that came back valid."""
+    ids = {f"img{i}": path for i, path in enumerate(image_paths, start=1)}
+    content = [{
+        "type": "text",
+        "text": (
+            f"{DESCRIBE_PROMPT}\n\nYou will receive {len(ids)} images, each preceded by its ID. "
+            'Return ONLY JSON: {"images": [{"id": "img1", "description": "..."}]} '
+            "with exactly one entry per image ID."
+        ),
+    }]
+    for image_id, path in ids.items():
+        content.append({"type": "text", "text": f"Image ID: {image_id}"})
+        content.append({
+            "type": "image_url",
+            "image_url": {"url": f"data:{_mime_type(path)};base64,{encode_image(path)}"},
+        })
+
+    response = client.chat.completions.create(
+        model="gpt-4o-mini",
+        response_format={"type": "json_object"},
+        messages=[{"role": "user", "content": content}],
+        max_tokens=DESCRIPTION_MAX_TOKENS * len(ids),
+    )
+
+    try:
+        items = json.loads(response.choices[0].message.content).get("images", [])
+    except (json.JSONDecodeError, AttributeError):
+        return {}
+
+    results = {}
+    for item in items if isinstance(items, list) else []:
+        if not isinstance(item, dict):
+            continue
+        path = ids.get(str(item.get("id", "")).strip())
+        description = item.get("description")
+        if path and isinstance(description, str) and description.strip():
+            results[path] = description.strip()
+    return results
+
+
+def describe_images(client: OpenAI, image_paths: List[str], token_budget: int = BATCH_INPUT_TOKENS,
+                    stats: Optional[dict] = None) -> Dict[str, str]:
+    """
+    Batched describe_image: packs images into requests sized by token_budget and
+    asks for a JSON array of descriptions keyed by image ID. Images missing or
+    invalid in a batch response are retried one by one. Returns {path: description};
+    images that still fail are left out. stats, if given, receives request counts.
+    """
+    stats = stats if stats is not None else {}
+    stats.setdefault("batch_requests", 0)
+    stats.setdefault("single_requests", 0)
+
+    results: Dict[str, str] = {}
+    for batch in plan_batches(image_paths, token_budget):
+        if len(batch) > 1:
+            stats["batch_requests"] += 1
+            try:
+                results.update(_describe_batch(client, batch))
+            except Exception as e:
+                print(f"Batch description failed ({len(batch)} images), retrying individually: {e}")
+
+        for path in batch:
+            if path in results:
+                continue
+            stats["single_requests"] += 1
+            try:
+                results[path] = describe_image(client, path)
+            except Exception as e:
+                print(f"Could not describe {path}: {e}")
+    return results
+
+
+# ================= DISPLAY DERIVATIVES =================
+def _derivative_format():
+    return ("WEBP", "webp") if features.check("webp") else ("JPEG", "jpg")
+
+
+def _encode(img: Image.Image, width: int) -> bytes:
+    img = img.copy()
+    img.thumbnail((width, width * 4))  # never upscales
+    fmt, _ = _derivative_format()
+    if fmt == "JPEG" and img.mode not in ("RGB", "L"):
+        img = img.convert("RGB")
+    buf = BytesIO()
+    if fmt == "WEBP":
+        img.save(buf, format=fmt, quality=82, method=4)
+    else:
+        img.save(buf, format=fmt, quality=82, optimize=True)
+    return buf.getvalue()
+
+
+def make_derivatives(image_path: str, digest: str):
+    """Decodes the source once and writes every DERIVATIVE_WIDTHS version to DERIVATIVE_DIR."""
+    os.makedirs(DERIVATIVE_DIR, exist_ok=True)
+    _, ext = _derivative_format()
+    with Image.open(image_path) as src:
+        img = ImageOps.exif_transpose(src)  # re-encoding drops EXIF, so apply the rotation now
+        for width in DERIVATIVE_WIDTHS:
+            out = os.path.join(DERIVATIVE_DIR, f"{digest}_{width}.{ext}")
+            if not os.path.exists(out):
+                data = _encode(img, width)
+                tmp = f"{out}.tmp"
+                with open(tmp, "wb") as f:
+                    f.write(data)
+                os.replace(tmp, out)
+
+
+@lru_cache(maxsize=256)
+def _derivative_bytes(digest: str, image_path: str, width: int) -> bytes:
+    _, ext = _derivative_format()
+    out = os.path.join(DERIVATIVE_DIR, f"{digest}_{width}.{ext}")
+    if not os.path.exists(out):
+        if width in DERIVATIVE_WIDTHS:
+            make_derivatives(image_path, digest)
+        else:
+            with Image.open(image_path) as src:
+                return _encode(ImageOps.exif_transpose(src), width)
+    with open(out, "rb") as f:
+        return f.read()
+
+
+def display_image(image_path: str, width: int = DISPLAY_WIDTH) -> bytes:
+    """
+    Bytes of a resized WebP/JPEG version of image_path for st.image.
+    Derivatives are keyed by source content hash on disk and served from an
+    in-memory LRU, so reruns don't re-read or re-send the full-resolution file.
+    Falls back to the original bytes if the image can't be decoded.
+    """
+    # same mtime/size-keyed cache as the corpus scan (knowledge_base imports this module)
+    from utils.knowledge_base import _cached_sha256
+
+    stat = os.stat(image_path)
+    digest = _cached_sha256(image_path, stat.st_mtime_ns, stat.st_size)
+    try:
+        return _derivative_bytes(digest, image_path, width)
+    except Exception:
+        with open(image_path, "rb") as f:
+            return f.read()
@@ -0,0 +1,100 @@
+import json
+import os
+from typing import Dict, Iterable, List
+
+from langchain_core.documents import Document
+
+from utils.lexical_index import tokenize
+
+REGISTRY_PATH = os.path.join("config", "image_registry.json")
+MIN_TAG_MATCHES = 2  # single generic tags ("no", "led") are not an exact hit on their own
+
+
+def load_registry(path: str = REGISTRY_PATH) -> List[dict]:
+    """Entries of config/image_registry.json ({image_id, path, procedure, tags, description})."""
+    if not os.path.exists(path):
+        return []
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f).get("images", [])
+
+
+def match_corpus(registry: List[dict], corpus: List[dict], doc_dir: str, verbose: bool = True) -> Dict[str, dict]:
+    """
+    Maps corpus sources (see knowledge_base.scan_corpus) to registry entries.
+    Registry paths are relative to the project root ('documents/images/...');
+    when a path is stale, a file with the same name elsewhere in the corpus is used
+    if that name is unique.
+    """
+    by_path, by_name = {}, {}
+    for entry in corpus:
+        for rel in [entry["source"]] + entry["aliases"]:
+            by_path[rel.replace("\\", "/")] = entry
+            by_name.setdefault(os.path.basename(rel).lower(), set()).add(entry["source"])
+
+    matched = {}
+    for item in registry:
+        rel = os.path.relpath(os.path.normpath(item["path"]), os.path.normpath(doc_dir)).replace("\\", "/")
+        entry = by_path.get(rel)
+        if entry is None:
+            candidates = by_name.get(os.path.basename(rel).lower(), set())
+            if len(candidates) == 1:
+                entry = by_path[next(iter(candidates))]
+        if entry is None:
+            if verbose:
+                print(f"Image registry: {item['image_id']} not found ({item['path']})")
+            continue
+        matched.setdefault(entry["source"], item)
+    return matched
+
+
+def registry_document(item: dict, entry: dict) -> Document:
+    """Searchable image Document built from the registry text (no vision call)."""
+    tags = item.get("tags", [])
+    content = (
+        f"Image related to: {', '.join([entry['source']] + entry['aliases'])}\n"
+        f"Description: {item.get('description', '')}\n"
+        f"Tags: {', '.join(tags)}\n"
+        f"Procedure: {item.get('procedure', '')}"
+    )
+    return Document(page_content=content, metadata={
+        "source": entry["source"], "sha256": entry["sha256"], "aliases": entry["aliases"],
+        "type": "image", "full_path": entry["path"],
+        "image_id": item["image_id"], "tags": tags, "procedure": item.get("procedure"),
+    })
+
+
+class TagIndex:
+    """Inverted index tag -> image documents, for exact tag hits on image queries."""
+
+    def __init__(self):
+        self.docs: Dict[str, Document] = {}
+        self.postings: Dict[str, set] = {}
+
+    def __len__(self):
+        return len(self.docs)
+
+    def add_documents(self, docs: Iterable[Document]):
+        for doc in docs:
+            image_id = doc.metadata.get("image_id")
+            if not image_id or not doc.metadata.get("tags"):
+                continue
+            self.docs[image_id] = doc
+            for tag in doc.metadata["tags"]:
+                for term in tokenize(tag):
+                    self.postings.setdefault(term, set()).add(image_id)
+
+    def search(self, query: str, k: int = 2, min_matches: int = MIN_TAG_MATCHES) -> List[Document]:
+        """Images sharing at least min_matches tags with the query (or all of theirs), most matches first."""
+        hits: Dict[str, int] = {}
+        for term in set(tokenize(query)):
+            for image_id in self.postings.get(term, ()):
+                hits[image_id] = hits.get(image_id, 0) + 1
+
+        ranked = []
+        for image_id, count in hits.items():
+            n_tags = len(self.docs[image_id].metadata["tags"])
+            if count >= min(min_matches, n_tags):
+                ranked.append((count, count / n_tags, image_id))
+        ranked.sort(reverse=True)
+        return [self.docs[image_id] for _, _, image_id in ranked[:k]]
+
@@ -0,0 +1,437 @@
+import re
+import sqlite3
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+
+DB_PATH = "inventory.db"
+CACHED_STATEMENTS = 256  # prepared statements kept per connection (sqlite3 default is 128)
+VERSIONED_TABLES = ("technicians", "item_types", "items", "assignments")
+OVERDUE_DAYS = 14  # Friday Check: open assignments older than this are flagged
+
+PRAGMAS = (
+    "PRAGMA foreign_keys = ON;",
+    "PRAGMA journal_mode = WAL;",
+    "PRAGMA synchronous = NORMAL;",
+)
+
+SCHEMA = (
+    """
+    CREATE TABLE IF NOT EXISTS technicians (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT NOT NULL UNIQUE,
+        email TEXT,
+        active INTEGER NOT NULL DEFAULT 1 CHECK(active IN (0,1)),
+        created_at TEXT NOT NULL
+    );
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS item_types (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT NOT NULL UNIQUE
+    );
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS items (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        serial_number TEXT NOT NULL UNIQUE,
+        asset_tag TEXT,
+        item_type_id INTEGER NOT NULL,
+        description TEXT,
+        status TEXT NOT NULL CHECK(status IN ('AVAILABLE','IN_FIELD','INSTALLED','LOST','DAMAGED')),
+        created_at TEXT NOT NULL,
+        FOREIGN KEY(item_type_id) REFERENCES item_types(id)
+    );
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS assignments (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        item_id INTEGER NOT NULL,
+        technician_id INTEGER NOT NULL,
+        request_date TEXT,
+        issued_date TEXT,
+        installed_date TEXT,
+        returned_date TEXT,
+        location_place_name TEXT,
+        rdl TEXT,
+        notes TEXT,
+        closed INTEGER NOT NULL DEFAULT 0 CHECK(closed IN (0,1)),
+        created_at TEXT NOT NULL,
+        FOREIGN KEY(item_id) REFERENCES items(id),
+        FOREIGN KEY(technician_id) REFERENCES technicians(id)
+    );
+    """,
+    # Superseded by idx_assignments_open_cover (the planner kept picking it and reading the table)
+    "DROP INDEX IF EXISTS idx_assignments_open;",
+    # Helpful indexes
+    "CREATE INDEX IF NOT EXISTS idx_assignments_item ON assignments(item_id);",
+    "CREATE INDEX IF NOT EXISTS idx_assignments_tech_created ON assignments(technician_id, created_at);",
+    "CREATE INDEX IF NOT EXISTS idx_items_type_status ON items(item_type_id, status);",
+    # Item picker: case-insensitive prefix search (LIKE 'abc%' uses these)
+    "CREATE INDEX IF NOT EXISTS idx_items_serial_nocase ON items(serial_number COLLATE NOCASE);",
+    "CREATE INDEX IF NOT EXISTS idx_items_asset_tag_nocase ON items(asset_tag COLLATE NOCASE);",
+    # Friday Check: covers every assignment column it reads, open assignments only
+    """
+    CREATE INDEX IF NOT EXISTS idx_assignments_open_cover
+    ON assignments(technician_id, item_id, issued_date, request_date, installed_date, location_place_name, rdl, notes,
+                   closed)
+    WHERE closed = 0;
+    """,
+    # Bumped by every write transaction, part of the page's query cache keys
+    """
+    CREATE TABLE IF NOT EXISTS data_versions (
+        name TEXT PRIMARY KEY,
+        version INTEGER NOT NULL DEFAULT 0
+    );
+    """,
+)
+
+# Full-text search over items + assignments, kept in sync by triggers.
+# rowid = item id * 2 for items, assignment id * 2 + 1 for assignments
+# (assignment rows repeat their item's serial / asset tag / description).
+SEARCH_SCHEMA = (
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS inventory_fts USING fts5(
+        serial_number, asset_tag, description, location_place_name, rdl, notes,
+        tokenize = 'unicode61 remove_diacritics 2',
+        prefix = '2 3 4'
+    );
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS items_fts_ai AFTER INSERT ON items BEGIN
+        INSERT INTO inventory_fts(rowid, serial_number, asset_tag, description)
+        VALUES (new.id * 2, new.serial_number, new.asset_tag, new.description);
+    END;
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS items_fts_au AFTER UPDATE OF serial_number, asset_tag, description ON items BEGIN
+        UPDATE inventory_fts
+        SET serial_number = new.serial_number, asset_tag = new.asset_tag, description = new.description
+        WHERE rowid = new.id * 2;
+        UPDATE inventory_fts
+        SET serial_number = new.serial_number, asset_tag = new.asset_tag, description = new.description
+        WHERE rowid IN (SELECT id * 2 + 1 FROM assignments WHERE item_id = new.id);
+    END;
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS items_fts_ad AFTER DELETE ON items BEGIN
+        DELETE FROM inventory_fts WHERE rowid = old.id * 2;
+    END;
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS assignments_fts_ai AFTER INSERT ON assignments BEGIN
+        INSERT INTO inventory_fts(rowid, serial_number, asset_tag, description, location_place_name, rdl, notes)
+        SELECT new.id * 2 + 1, i.serial_number, i.asset_tag, i.description, new.location_place_name, new.rdl, new.notes
+        FROM items i WHERE i.id = new.item_id;
+    END;
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS assignments_fts_au
+    AFTER UPDATE OF item_id, location_place_name, rdl, notes ON assignments BEGIN
+        DELETE FROM inventory_fts WHERE rowid = old.id * 2 + 1;
+        INSERT INTO inventory_fts(rowid, serial_number, asset_tag, description, location_place_name, rdl, notes)
+        SELECT new.id * 2 + 1, i.serial_number, i.asset_tag, i.description, new.location_place_name, new.rdl, new.notes
+        FROM items i WHERE i.id = new.item_id;
+    END;
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS assignments_fts_ad AFTER DELETE ON assignments BEGIN
+        DELETE FROM inventory_fts WHERE rowid = old.id * 2 + 1;
+    END;
+    """,
+)
+
+# Tables without their own version, written by triggers on these tables
+DERIVED_TABLES = {"inventory_fts": ("items", "assignments")}
+
+_TABLE_RE = re.compile(r"\b(?:FROM|JOIN|INTO|UPDATE)\s+([A-Za-z_]\w*)", re.IGNORECASE)
+
+
+class ConnectionPool:
+    """
+    One SQLite connection per thread, opened (and PRAGMA-configured) once and reused.
+    Streamlit runs each script run in a short-lived thread, so connections owned by
+    finished threads are handed to the next thread instead of being reopened.
+    Connections are in autocommit mode; writes go through transaction().
+    """
+
+    def __init__(self, path: str = DB_PATH, cached_statements: int = CACHED_STATEMENTS):
+        self.path = path
+        self.cached_statements = cached_statements
+        self.opened = 0
+        self._lock = threading.Lock()
+        self._by_thread: Dict[int, Tuple[threading.Thread, sqlite3.Connection]] = {}
+        self._idle: List[sqlite3.Connection] = []
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, check_same_thread=False, timeout=30,
+                               isolation_level=None, cached_statements=self.cached_statements)
+        for pragma in PRAGMAS:
+            conn.execute(pragma)
+        self.opened += 1
+        return conn
+
+    def connection(self) -> sqlite3.Connection:
+        """The calling thread's connection."""
+        thread = threading.current_thread()
+        entry = self._by_thread.get(thread.ident)
+        if entry is not None and entry[0] is thread:
+            return entry[1]
+
+        with self._lock:
+            for ident, (owner, conn) in list(self._by_thread.items()):
+                if not owner.is_alive():
+                    del self._by_thread[ident]
+                    if conn.in_transaction:  # thread died mid-write
+                        conn.rollback()
+                    self._idle.append(conn)
+            conn = self._idle.pop() if self._idle else self._connect()
+            self._by_thread[thread.ident] = (thread, conn)
+        return conn
+
+    @contextmanager
+    def transaction(self, *tables: str):
+        """
+        BEGIN IMMEDIATE ... COMMIT on this thread's connection (rollback on error).
+        The data version of each written table is bumped in the same transaction.
+        Nested blocks join the outer transaction.
+        """
+        conn = self.connection()
+        if conn.in_transaction:
+            bump_versions(conn, tables)
+            yield conn
+            return
+        conn.execute("BEGIN IMMEDIATE;")
+        bump_versions(conn, tables)
+        try:
+            yield conn
+        except BaseException:
+            conn.rollback()
+            raise
+        conn.commit()
+
+    def close_all(self):
+        with self._lock:
+            for _, conn in self._by_thread.values():
+                conn.close()
+            for conn in self._idle:
+                conn.close()
+            self._by_thread.clear()
+            self._idle.clear()
+
+
+def init_db(pool: ConnectionPool):
+    with pool.transaction() as conn:
+        has_search = conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'inventory_fts';").fetchone()
+        for statement in SCHEMA + SEARCH_SCHEMA:
+            conn.execute(statement)
+        if not has_search:  # existing database: index what is already there
+            rebuild_search_index(conn)
+        conn.executemany("INSERT OR IGNORE INTO data_versions(name) VALUES (?);",
+                         [(t,) for t in VERSIONED_TABLES])
+
+
+def rebuild_search_index(conn: sqlite3.Connection):
+    conn.execute("DELETE FROM inventory_fts;")
+    conn.execute("""
+        INSERT INTO inventory_fts(rowid, serial_number, asset_tag, description)
+        SELECT id * 2, serial_number, asset_tag, description FROM items;
+    """)
+    conn.execute("""
+        INSERT INTO inventory_fts(rowid, serial_number, asset_tag, description, location_place_name, rdl, notes)
+        SELECT a.id * 2 + 1, i.serial_number, i.asset_tag, i.description, a.location_place_name, a.rdl, a.notes
+        FROM assignments a JOIN items i ON i.id = a.item_id;
+    """)
+
+
+def fts_query(text: str) -> Optional[str]:
+    """'Shoppers Markham' -> '"Shoppers"* "Markham"*' (every word, as a prefix); None if no words."""
+    terms = re.findall(r"\w+", text or "")
+    return " ".join(f'"{t}"*' for t in terms) or None
+
+
+def tables_in(query: str) -> Tuple[str, ...]:
+    """Versioned tables a statement reads or writes (FROM / JOIN / INTO / UPDATE)."""
+    found = {name.lower() for name in _TABLE_RE.findall(query)}
+    for name, sources in DERIVED_TABLES.items():
+        if name in found:
+            found.update(sources)
+    return tuple(t for t in VERSIONED_TABLES if t in found)
+
+
+def bump_versions(conn: sqlite3.Connection, tables: Iterable[str]):
+    tables = tuple(tables)
+    if not tables:
+        return
+    conn.executemany("UPDATE data_versions SET version = version + 1 WHERE name = ?;",
+                     [(t,) for t in tables])
+
+
+def data_versions(conn: sqlite3.Connection, tables: Iterable[str]) -> Tuple[int, ...]:
+    """Current versions of `tables`, in the given order (committed writes only)."""
+    tables = tuple(tables)
+    if not tables:
+        return ()
+    rows = dict(conn.execute("SELECT name, version FROM data_versions;").fetchall())
+    return tuple(rows.get(t, 0) for t in tables)
+
+
+# =========================
+# Inventory operations (one transaction each)
+# =========================
+class InventoryError(Exception):
+    pass
+
+
+class ItemNotAvailable(InventoryError):
+    def __init__(self, serial_number: str, status: str):
+        super().__init__(f"Item {serial_number} is {status}, not AVAILABLE")
+        self.serial_number = serial_number
+        self.status = status
+
+
+class AssignmentClosed(InventoryError):
+    pass
+
+
+def _now() -> str:
+    return datetime.utcnow().isoformat()
+
+
+def issue_item(pool: ConnectionPool, item_id: int, technician_id: int, request_date=None, issued_date=None,
+               location_place_name=None, rdl=None, notes=None, require_available: bool = True) -> int:
+    """Opens an assignment and moves the item to IN_FIELD. Returns the assignment id."""
+    with pool.transaction("items", "assignments") as conn:
+        row = conn.execute("SELECT serial_number, status FROM items WHERE id = ?;", (item_id,)).fetchone()
+        if row is None:
+            raise InventoryError(f"Item {item_id} not found")
+        if require_available and row[1] != "AVAILABLE":
+            raise ItemNotAvailable(row[0], row[1])
+        assignment_id = conn.execute("""
+            INSERT INTO assignments(
+                item_id, technician_id, request_date, issued_date,
+                location_place_name, rdl, notes, closed, created_at
+            )
+            VALUES (?, ?, ?, ?, ?, ?, ?, 0, ?);
+        """, (item_id, technician_id, request_date, issued_date, location_place_name, rdl, notes, _now())).lastrowid
+        conn.execute("UPDATE items SET status = 'IN_FIELD' WHERE id = ?;", (item_id,))
+    return assignment_id
+
+
+def issue_serial(pool: ConnectionPool, serial_number: str, item_type_id: int, technician_id: int,
+                 asset_tag=None, description=None, **assignment) -> Tuple[int, int]:
+    """
+    Quick Issue: registers the serial as AVAILABLE if it is new, then issues it,
+    all in one transaction. Returns (item_id, assignment_id).
+    """
+    with pool.transaction("items", "assignments") as conn:
+        row = conn.execute("SELECT id FROM items WHERE serial_number = ?;", (serial_number,)).fetchone()
+        if row is not None:
+            item_id = row[0]
+        else:
+            item_id = conn.execute("""
+                INSERT INTO items(serial_number, asset_tag, item_type_id, description, status, created_at)
+                VALUES (?, ?, ?, ?, 'AVAILABLE', ?);
+            """, (serial_number, asset_tag, item_type_id, description, _now())).lastrowid
+        assignment_id = issue_item(pool, item_id, technician_id, **assignment)
+    return item_id, assignment_id
+
+
+def _open_assignment_item(conn: sqlite3.Connection, assignment_id: int) -> int:
+    row = conn.execute("SELECT item_id, closed FROM assignments WHERE id = ?;", (assignment_id,)).fetchone()
+    if row is None:
+        raise InventoryError(f"Assignment {assignment_id} not found")
+    if row[1]:
+        raise AssignmentClosed(f"Assignment {assignment_id} is already closed")
+    return row[0]
+
+
+def install_item(pool: ConnectionPool, assignment_id: int, installed_date) -> int:
+    """Item INSTALLED, assignment stays open. Returns the item id."""
+    with pool.transaction("items", "assignments") as conn:
+        item_id = _open_assignment_item(conn, assignment_id)
+        conn.execute("UPDATE assignments SET installed_date = ? WHERE id = ?;", (installed_date, assignment_id))
+        conn.execute("UPDATE items SET status = 'INSTALLED' WHERE id = ?;", (item_id,))
+    return item_id
+
+
+def close_assignment(pool: ConnectionPool, assignment_id: int, item_status: str, returned_date) -> int:
+    """
+    Closes the assignment and sets the item status: AVAILABLE (returned), LOST or DAMAGED.
+    Raises AssignmentClosed if another session closed it first. Returns the item id.
+    """
+    if item_status not in ("AVAILABLE", "LOST", "DAMAGED"):
+        raise ValueError(f"Cannot close an assignment with item status {item_status}")
+    with pool.transaction("items", "assignments") as conn:
+        item_id = _open_assignment_item(conn, assignment_id)
+        conn.execute("UPDATE assignments SET closed = 1, returned_date = ? WHERE id = ?;",
+                     (returned_date, assignment_id))
+        conn.execute("UPDATE items SET status = ? WHERE id = ?;", (item_status, item_id))
+    return item_id
+
+
+def return_item(pool: ConnectionPool, assignment_id: int, returned_date) -> int:
+    return close_assignment(pool, assignment_id, "AVAILABLE", returned_date)
+
+
+def mark_lost_or_damaged(pool: ConnectionPool, assignment_id: int, status: str, returned_date) -> int:
+    if status not in ("LOST", "DAMAGED"):
+        raise ValueError(f"Expected LOST or DAMAGED, got {status}")
+    return close_assignment(pool, assignment_id, status, returned_date)
+
+
+def update_assignment(pool: ConnectionPool, assignment_id: int, installed_date=None, location_place_name=None,
+                      rdl=None, notes=None, outcome: Optional[str] = None, closed_date=None):
+    """
+    Assignments tab "Save Update": edits the assignment fields and applies the
+    outcome (None, INSTALLED, RETURNED, LOST or DAMAGED) in a single transaction.
+    """
+    with pool.transaction("assignments") as conn:
+        _open_assignment_item(conn, assignment_id)
+        conn.execute("""
+            UPDATE assignments
+            SET installed_date = ?, location_place_name = ?, rdl = ?, notes = ?
+            WHERE id = ?;
+        """, (installed_date, location_place_name, rdl, notes, assignment_id))
+        if outcome == "INSTALLED":
+            install_item(pool, assignment_id, installed_date)
+        elif outcome == "RETURNED":
+            return_item(pool, assignment_id, closed_date)
+        elif outcome in ("LOST", "DAMAGED"):
+            mark_lost_or_damaged(pool, assignment_id, outcome, closed_date)
+        elif outcome is not None:
+            raise ValueError(f"Unknown outcome {outcome}")
+
+
+SQL_VARIABLE_CHUNK = 500  # parameters per IN (...) lookup, well under SQLite's limit
+
+
+def existing_serials(conn: sqlite3.Connection, serials: Iterable[str]) -> set:
+    """Subset of `serials` already registered in items."""
+    serials = list(serials)
+    found = set()
+    for i in range(0, len(serials), SQL_VARIABLE_CHUNK):
+        chunk = serials[i:i + SQL_VARIABLE_CHUNK]
+        marks = ",".join("?" * len(chunk))
+        found.update(r[0] for r in conn.execute(
+            f"SELECT serial_number FROM items WHERE serial_number IN ({marks});", chunk))
+    return found
+
+
+def bulk_add_items(pool: ConnectionPool, serials: Iterable[str], item_type_id: int, status: str = "AVAILABLE",
+                   asset_tag=None, description=None) -> Tuple[List[str], List[str]]:
+    """
+    Registers many serials of one type with a single executemany in one transaction.
+    Returns (inserted, already_existing); duplicates within `serials` are inserted once.
+    """
+    serials = list(dict.fromkeys(serials))
+    with pool.transaction("items") as conn:
+        existing = existing_serials(conn, serials)
+        new = [sn for sn in serials if sn not in existing]
+        created_at = _now()
+        conn.executemany("""
+            INSERT INTO items(serial_number, asset_tag, item_type_id, description, status, created_at)
+            VALUES (?, ?, ?, ?, ?, ?);
+        """, [(sn, asset_tag, item_type_id, description, status, created_at) for sn in new])
+    return new, [sn for sn in serials if sn in existing]
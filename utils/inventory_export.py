@@ -0,0 +1,200 @@
+import argparse
+import csv
+import io
+import sys
+import tempfile
+from typing import IO, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from utils.inventory_db import DB_PATH, ConnectionPool, init_db
+
+CHUNK_ROWS = 5000
+XLSX_MAX_ROWS = 1_048_575  # sheet limit minus the header row
+
+EXPORT_FORMATS = {
+    "csv": "text/csv",
+    "parquet": "application/vnd.apache.parquet",
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+}
+
+# name -> (query, date expression for the date range, status column, order)
+EXPORTS = {
+    "items": ("""
+        SELECT
+            i.id,
+            it.name AS item_type,
+            i.serial_number,
+            i.asset_tag,
+            i.description,
+            i.status,
+            i.created_at
+        FROM items i
+        JOIN item_types it ON it.id = i.item_type_id
+    """, "date(i.created_at)", "i.status", "i.id"),
+    "assignments": ("""
+        SELECT
+            a.id AS assignment_id,
+            t.name AS technician,
+            it.name AS item_type,
+            i.serial_number,
+            i.asset_tag,
+            i.status,
+            a.request_date,
+            a.issued_date,
+            a.installed_date,
+            a.returned_date,
+            a.location_place_name,
+            a.rdl,
+            a.notes,
+            a.closed,
+            a.created_at
+        FROM assignments a
+        JOIN technicians t ON t.id = a.technician_id
+        JOIN items i ON i.id = a.item_id
+        JOIN item_types it ON it.id = i.item_type_id
+    """, "COALESCE(a.issued_date, a.request_date, date(a.created_at))", "i.status", "a.id"),
+}
+
+INTEGER_COLUMNS = ("id", "closed")
+
+
+def export_query(name: str, date_from: Optional[str] = None, date_to: Optional[str] = None,
+                 statuses: Optional[Sequence[str]] = None) -> Tuple[str, list]:
+    """SQL + params for one of EXPORTS, filtered by an inclusive ISO date range and item statuses."""
+    query, date_expr, status_col, order = EXPORTS[name]
+    where, params = [], []
+    if date_from:
+        where.append(f"{date_expr} >= ?")
+        params.append(date_from)
+    if date_to:
+        where.append(f"{date_expr} <= ?")
+        params.append(date_to)
+    if statuses:
+        where.append(f"{status_col} IN ({','.join('?' * len(statuses))})")
+        params.extend(statuses)
+    if where:
+        query += " WHERE " + " AND ".join(where)
+    return query + f" ORDER BY {order}", params
+
+
+def iter_chunks(conn, query: str, params: Iterable = (),
+                chunk_rows: int = CHUNK_ROWS) -> Iterator[Tuple[List[str], List[tuple]]]:
+    """(columns, rows) for every chunk_rows rows fetched from one cursor."""
+    cur = conn.execute(query, tuple(params))
+    columns = [d[0] for d in cur.description]
+    while True:
+        rows = cur.fetchmany(chunk_rows)
+        if not rows:
+            break
+        yield columns, rows
+
+
+def _write_csv(chunks, columns: List[str], out: IO[bytes]) -> int:
+    text = io.TextIOWrapper(out, encoding="utf-8", newline="")
+    writer = csv.writer(text)
+    writer.writerow(columns)
+    n = 0
+    for _, rows in chunks:
+        writer.writerows(rows)
+        n += len(rows)
+    text.flush()
+    text.detach()  # leave `out` open for the caller
+    return n
+
+
+def _write_parquet(chunks, columns: List[str], out: IO[bytes]) -> int:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = pa.schema([
+        (c, pa.int64() if c in INTEGER_COLUMNS or c.endswith("_id") else pa.string()) for c in columns
+    ])
+    n = 0
+    with pq.ParquetWriter(out, schema) as writer:
+        for _, rows in chunks:
+            arrays = [
+                pa.array([r[i] if f.type == pa.int64() or r[i] is None else str(r[i]) for r in rows], type=f.type)
+                for i, f in enumerate(schema)
+            ]
+            writer.write_table(pa.Table.from_arrays(arrays, schema=schema))
+            n += len(rows)
+        if n == 0:
+            writer.write_table(schema.empty_table())
+    return n
+
+
+def _write_xlsx(chunks, columns: List[str], out: IO[bytes], sheet: str) -> int:
+    from openpyxl import Workbook
+
+    wb = Workbook(write_only=True)  # rows go straight to a temp file, not kept in memory
+    ws = wb.create_sheet(sheet[:31])
+    ws.append(columns)
+    n = 0
+    for _, rows in chunks:
+        if n + len(rows) > XLSX_MAX_ROWS:
+            raise ValueError(f"More than {XLSX_MAX_ROWS} rows do not fit in one XLSX sheet; use CSV or Parquet")
+        for row in rows:
+            ws.append(row)
+        n += len(rows)
+    wb.save(out)
+    return n
+
+
+def write_export(conn, query: str, params: Iterable, fmt: str, out: IO[bytes],
+                 chunk_rows: int = CHUNK_ROWS, sheet: str = "export") -> int:
+    """Streams the query result into `out` (binary) as csv / parquet / xlsx. Returns the row count."""
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"Unknown export format {fmt} (expected one of {', '.join(EXPORT_FORMATS)})")
+    cur = conn.execute(f"SELECT * FROM ({query}) LIMIT 0", tuple(params))
+    columns = [d[0] for d in cur.description]
+    chunks = iter_chunks(conn, query, params, chunk_rows)
+    if fmt == "csv":
+        return _write_csv(chunks, columns, out)
+    if fmt == "parquet":
+        return _write_parquet(chunks, columns, out)
+    return _write_xlsx(chunks, columns, out, sheet)
+
+
+def export_file(pool: ConnectionPool, query: str, params: Iterable, fmt: str, **kwargs) -> IO[bytes]:
+    """
+    Export written to an anonymous temp file (rewound), e.g. as the data callable
+    of st.download_button, so nothing is generated until somebody clicks it.
+    """
+    out = tempfile.TemporaryFile()
+    write_export(pool.connection(), query, params, fmt, out, **kwargs)
+    out.seek(0)
+    return out
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export Tech Inventory items / assignments without loading them in memory.")
+    parser.add_argument("name", choices=sorted(EXPORTS))
+    parser.add_argument("output", help="Output file; the format comes from --format or the extension")
+    parser.add_argument("--db", default=DB_PATH)
+    parser.add_argument("--format", choices=sorted(EXPORT_FORMATS), default=None)
+    parser.add_argument("--from", dest="date_from", default=None, help="YYYY-MM-DD (inclusive)")
+    parser.add_argument("--to", dest="date_to", default=None, help="YYYY-MM-DD (inclusive)")
+    parser.add_argument("--status", nargs="+", default=None, help="Item statuses, e.g. IN_FIELD INSTALLED")
+    args = parser.parse_args(argv)
+
+    fmt = args.format or args.output.rsplit(".", 1)[-1].lower()
+    if fmt not in EXPORT_FORMATS:
+        print(f"Cannot tell the format from {args.output}; use --format")
+        return 1
+
+    pool = ConnectionPool(args.db)
+    init_db(pool)
+    query, params = export_query(args.name, args.date_from, args.date_to, args.status)
+    try:
+        with open(args.output, "wb") as out:
+            n = write_export(pool.connection(), query, params, fmt, out, sheet=args.name)
+    except (ImportError, ValueError) as e:
+        print(e)
+        return 1
+    finally:
+        pool.close_all()
+    print(f"{n} rows -> {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
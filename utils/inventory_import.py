@@ -0,0 +1,342 @@
+import argparse
+import csv
+import os
+import sys
+import time
+from datetime import date, datetime
+from typing import IO, Dict, Iterator, List, Optional, Union
+
+import pandas as pd
+
+from utils.inventory_db import DB_PATH, SQL_VARIABLE_CHUNK, ConnectionPool, init_db
+
+CHUNK_ROWS = 5000
+STATUSES = ("AVAILABLE", "IN_FIELD", "INSTALLED", "LOST", "DAMAGED")
+DATE_FIELDS = ("request_date", "issued_date", "installed_date", "returned_date")
+# Text date formats offered by the Import section (ISO dates are always accepted)
+DATE_FORMATS = {"YYYY-MM-DD": None, "DD/MM/YYYY": "%d/%m/%Y", "MM/DD/YYYY": "%m/%d/%Y"}
+
+# Spreadsheet header (lower case, spaces/dashes as '_') -> field
+COLUMN_ALIASES = {
+    "serial_number": "serial_number", "serial": "serial_number", "sn": "serial_number", "s_n": "serial_number",
+    "asset_tag": "asset_tag", "asset": "asset_tag", "tag": "asset_tag",
+    "item_type": "item_type", "type": "item_type", "tipo": "item_type",
+    "description": "description", "descricao": "description", "descrição": "description",
+    "status": "status",
+    "technician": "technician", "tech": "technician", "tecnico": "technician", "técnico": "technician",
+    "request_date": "request_date", "issued_date": "issued_date",
+    "installed_date": "installed_date", "returned_date": "returned_date",
+    "location_place_name": "location_place_name", "place_name": "location_place_name",
+    "place": "location_place_name", "location": "location_place_name",
+    "rdl": "rdl", "notes": "notes",
+}
+
+
+def _field(header) -> Optional[str]:
+    key = "_".join(str(header or "").strip().lower().replace("-", " ").replace("/", " ").split())
+    return COLUMN_ALIASES.get(key)
+
+
+def _text(value) -> Optional[str]:
+    if value is None or (isinstance(value, float) and pd.isna(value)):
+        return None
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)  # Excel stores numeric serials as floats
+    if isinstance(value, (datetime, date)):
+        value = value.isoformat()
+    text = " ".join(str(value).split())
+    return text or None
+
+
+def read_chunks(source: Union[str, IO], filename: Optional[str] = None,
+                chunk_rows: int = CHUNK_ROWS, sheet: Optional[str] = None) -> Iterator[pd.DataFrame]:
+    """
+    Streams a CSV or XLSX file as DataFrames of at most chunk_rows rows
+    (object columns, headers as in the file). XLSX is read with openpyxl in
+    read-only mode so large workbooks are never fully loaded.
+    """
+    name = (filename or (source if isinstance(source, str) else getattr(source, "name", ""))).lower()
+    if name.endswith((".xlsx", ".xlsm")):
+        from openpyxl import load_workbook
+
+        wb = load_workbook(source, read_only=True, data_only=True)
+        try:
+            ws = wb[sheet] if sheet else wb.active
+            rows = ws.iter_rows(values_only=True)
+            header = next(rows, None)
+            if header is None:
+                return
+            batch = []
+            for row in rows:
+                if any(v is not None for v in row):
+                    batch.append(row)
+                if len(batch) == chunk_rows:
+                    yield pd.DataFrame(batch, columns=header, dtype=object)
+                    batch = []
+            if batch:
+                yield pd.DataFrame(batch, columns=header, dtype=object)
+        finally:
+            wb.close()
+    else:
+        yield from pd.read_csv(source, dtype=str, keep_default_na=False, chunksize=chunk_rows)
+
+
+def _parse_date(value, date_format: Optional[str] = None) -> Optional[str]:
+    """
+    ISO date for a spreadsheet date cell or a text date, which must be ISO
+    (YYYY-MM-DD, optionally with a time) or match date_format exactly. Nothing
+    is guessed: anything else is None.
+    """
+    if isinstance(value, datetime):
+        return value.date().isoformat()
+    if isinstance(value, date):
+        return value.isoformat()
+    text = _text(value)
+    if not text:
+        return None
+    try:
+        return datetime.fromisoformat(text).date().isoformat()
+    except ValueError:
+        pass
+    if date_format:
+        try:
+            return datetime.strptime(text, date_format).date().isoformat()
+        except ValueError:
+            pass
+    return None
+
+
+def _prepare(chunk: pd.DataFrame, date_format: Optional[str] = None) -> pd.DataFrame:
+    """Renames known columns to their field names; date columns become ISO dates (None if unparseable)."""
+    columns = {}
+    for col in chunk.columns:
+        field = _field(col)
+        if field and field not in columns.values():
+            columns[col] = field
+    chunk = chunk[list(columns)].rename(columns=columns)
+    for field in DATE_FIELDS:
+        if field in chunk:
+            raw = chunk[field]
+            chunk[field] = [_parse_date(v, date_format) for v in raw]
+            chunk[field + "_raw"] = raw.map(_text)
+    return chunk
+
+
+def _lookup(conn, table: str) -> Dict[str, int]:
+    return {name.lower(): id_ for id_, name in conn.execute(f"SELECT id, name FROM {table};")}
+
+
+def _ids_by_serial(conn, serials: List[str]) -> Dict[str, int]:
+    ids = {}
+    for i in range(0, len(serials), SQL_VARIABLE_CHUNK):
+        chunk = serials[i:i + SQL_VARIABLE_CHUNK]
+        marks = ",".join("?" * len(chunk))
+        ids.update(conn.execute(f"SELECT serial_number, id FROM items WHERE serial_number IN ({marks});", chunk))
+    return ids
+
+
+def _item_status(row: dict) -> str:
+    """Explicit status column, otherwise derived from the assignment dates."""
+    if row.get("status"):
+        return row["status"].upper()
+    if not row.get("technician") or row.get("returned_date"):
+        return "AVAILABLE"
+    return "INSTALLED" if row.get("installed_date") else "IN_FIELD"
+
+
+def _closed(row: dict) -> bool:
+    return bool(row.get("returned_date")) or row["status"] in ("AVAILABLE", "LOST", "DAMAGED")
+
+
+def import_records(pool: ConnectionPool, source: Union[str, IO], filename: Optional[str] = None,
+                   chunk_rows: int = CHUNK_ROWS, create_missing: bool = True, sheet: Optional[str] = None,
+                   date_format: Optional[str] = None) -> dict:
+    """
+    Imports items (and, for rows with a technician, their assignments) from a
+    CSV/XLSX file in one transaction, chunk by chunk with executemany.
+
+    A serial already in the database before the import is a conflict and its
+    row is skipped, so re-running an import is harmless; a serial repeated in
+    the file adds one assignment per row (history) and keeps the last row's
+    status. A later row of the serial with a technician, or one that returns
+    it (returned_date / AVAILABLE / LOST / DAMAGED), closes its earlier
+    assignments (counted in superseded). Unknown item types / technicians are
+    created unless create_missing=False, in which case those rows are
+    conflicts. Text dates must be ISO or match date_format (e.g. '%d/%m/%Y')
+    for the whole file; other dates are conflicts. The result does not depend
+    on chunk_rows.
+
+    Returns {rows, items, assignments, superseded, types_created,
+    technicians_created, conflicts: [{row, serial_number, reason}], seconds}.
+    """
+    t0 = time.perf_counter()
+    report = {"rows": 0, "items": 0, "assignments": 0, "superseded": 0, "types_created": 0,
+              "technicians_created": 0, "conflicts": [], "seconds": 0.0}
+    now = datetime.utcnow().isoformat()
+    imported: Dict[str, int] = {}  # serial -> item id, for items created by this import
+
+    def conflict(row_no, serial, reason):
+        report["conflicts"].append({"row": row_no, "serial_number": serial, "reason": reason})
+
+    with pool.transaction("technicians", "item_types", "items", "assignments") as conn:
+        types = _lookup(conn, "item_types")
+        techs = _lookup(conn, "technicians")
+        row_no = 1  # header
+
+        for chunk in read_chunks(source, filename, chunk_rows, sheet):
+            chunk = _prepare(chunk, date_format)
+            if "serial_number" not in chunk:
+                raise ValueError("No serial number column (expected one of: serial_number, serial, sn)")
+
+            rows, typed = [], set()  # typed: serials of this chunk whose item type is already known
+            for record in chunk.to_dict("records"):
+                row_no += 1
+                row = {k: _text(v) for k, v in record.items()}
+                serial = row.get("serial_number")
+                if not serial:
+                    conflict(row_no, None, "missing serial number")
+                    continue
+                bad_dates = [f for f in DATE_FIELDS if row.get(f + "_raw") and not row.get(f)]
+                if bad_dates:
+                    expected = "YYYY-MM-DD" + (f" or {date_format}" if date_format else "")
+                    conflict(row_no, serial, f"invalid date in {', '.join(bad_dates)} (expected {expected})")
+                    continue
+                status = _item_status(row)
+                if status not in STATUSES:
+                    conflict(row_no, serial, f"invalid status {row['status']}")
+                    continue
+                row["status"] = status
+                row["row"] = row_no
+
+                type_name = row.get("item_type")
+                if serial not in imported and serial not in typed and not type_name:
+                    conflict(row_no, serial, "missing item type")
+                    continue
+                if type_name and type_name.lower() not in types:
+                    if not create_missing:
+                        conflict(row_no, serial, f"unknown item type {type_name}")
+                        continue
+                    types[type_name.lower()] = conn.execute(
+                        "INSERT INTO item_types(name) VALUES (?);", (type_name,)).lastrowid
+                    report["types_created"] += 1
+
+                tech = row.get("technician")
+                if tech and tech.lower() not in techs:
+                    if not create_missing:
+                        conflict(row_no, serial, f"unknown technician {tech}")
+                        continue
+                    techs[tech.lower()] = conn.execute(
+                        "INSERT INTO technicians(name, active, created_at) VALUES (?, 1, ?);", (tech, now)).lastrowid
+                    report["technicians_created"] += 1
+                rows.append(row)
+                typed.add(serial)
+
+            in_db = _ids_by_serial(conn, list({r["serial_number"] for r in rows if r["serial_number"] not in imported}))
+            new_items, status_updates, assignment_rows = {}, {}, []
+            last_closer: Dict[str, int] = {}  # serial -> last row that closes the serial's earlier assignments
+            for row in rows:
+                serial = row["serial_number"]
+                if serial in in_db:
+                    conflict(row["row"], serial, "serial already in database")
+                    continue
+                if serial in imported:
+                    status_updates[serial] = row["status"]
+                else:
+                    if serial in new_items:
+                        new_items[serial]["status"] = row["status"]
+                    else:
+                        new_items[serial] = dict(row)  # the row itself may also be an assignment row
+                if row.get("technician"):
+                    assignment_rows.append(row)
+                if row.get("technician") or _closed(row):
+                    last_closer[serial] = row["row"]
+
+            conn.executemany("""
+                INSERT INTO items(serial_number, asset_tag, item_type_id, description, status, created_at)
+                VALUES (?, ?, ?, ?, ?, ?);
+            """, [(sn, r.get("asset_tag"), types[r["item_type"].lower()], r.get("description"), r["status"], now)
+                  for sn, r in new_items.items()])
+            imported.update(_ids_by_serial(conn, list(new_items)))
+            conn.executemany("UPDATE items SET status = ? WHERE id = ?;",
+                             [(status, imported[sn]) for sn, status in status_updates.items()])
+
+            # Closing rows supersede the serial's earlier assignments, in this chunk or a previous one
+            report["superseded"] += conn.executemany(
+                "UPDATE assignments SET closed = 1 WHERE item_id = ? AND closed = 0;",
+                [(imported[sn],) for sn in last_closer if sn not in new_items]).rowcount
+            superseded = {r["row"] for r in assignment_rows if r["row"] < last_closer[r["serial_number"]]}
+            report["superseded"] += sum(1 for r in assignment_rows if r["row"] in superseded and not _closed(r))
+
+            conn.executemany("""
+                INSERT INTO assignments(
+                    item_id, technician_id, request_date, issued_date, installed_date, returned_date,
+                    location_place_name, rdl, notes, closed, created_at
+                )
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?);
+            """, [(imported[r["serial_number"]], techs[r["technician"].lower()],
+                   r.get("request_date"), r.get("issued_date"), r.get("installed_date"), r.get("returned_date"),
+                   r.get("location_place_name"), r.get("rdl"), r.get("notes"),
+                   1 if r["row"] in superseded or _closed(r) else 0, now)
+                  for r in assignment_rows])
+
+            report["rows"] = row_no - 1
+            report["items"] += len(new_items)
+            report["assignments"] += len(assignment_rows)
+
+    report["seconds"] = round(time.perf_counter() - t0, 2)
+    return report
+
+
+def write_conflicts(conflicts: List[dict], path: str):
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=["row", "serial_number", "reason"])
+        writer.writeheader()
+        writer.writerows(conflicts)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Import items / assignments into the Tech Inventory database.")
+    parser.add_argument("file", help="CSV or XLSX with a serial number column (plus item_type, technician, dates...)")
+    parser.add_argument("--db", default=DB_PATH)
+    parser.add_argument("--sheet", default=None, help="XLSX sheet (default: the active one)")
+    parser.add_argument("--chunk-rows", type=int, default=CHUNK_ROWS)
+    parser.add_argument("--date-format", default=None,
+                        help="Format of text dates that are not ISO, for the whole file, e.g. %%d/%%m/%%Y "
+                             "(default: ISO YYYY-MM-DD only; other dates are conflicts)")
+    parser.add_argument("--no-create", action="store_true",
+                        help="Unknown item types / technicians are conflicts instead of being created")
+    parser.add_argument("--conflicts", default=None, help="Write the conflict report to this CSV")
+    args = parser.parse_args(argv)
+
+    if not os.path.exists(args.file):
+        print(f"File not found: {args.file}")
+        return 1
+
+    pool = ConnectionPool(args.db)
+    init_db(pool)
+    try:
+        report = import_records(pool, args.file, chunk_rows=args.chunk_rows,
+                                create_missing=not args.no_create, sheet=args.sheet, date_format=args.date_format)
+    except ValueError as e:
+        print(e)
+        return 1
+    finally:
+        pool.close_all()
+
+    print(f"{report['rows']} rows -> {report['items']} items, {report['assignments']} assignments "
+          f"({report['superseded']} closed by a later row for the same serial; {report['types_created']} types, {report['technicians_created']} technicians created) "
+          f"in {report['seconds']}s; {len(report['conflicts'])} conflicts")
+    if report["conflicts"]:
+        if args.conflicts:
+            write_conflicts(report["conflicts"], args.conflicts)
+            print(f"Conflict report -> {args.conflicts}")
+        else:
+            for c in report["conflicts"][:20]:
+                print(f"  row {c['row']}: {c['serial_number'] or '-'}: {c['reason']}")
+            if len(report["conflicts"]) > 20:
+                print(f"  ... {len(report['conflicts']) - 20} more (use --conflicts FILE)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,78 @@
+from collections import deque
+from typing import Dict, List, Tuple
+
+
+class KeywordMatcher:
+    """
+    Aho-Corasick automaton over the keywords of a list of entries
+    (e.g. image_query_map items: {"keywords": [...], ...}).
+
+    Compiled once; match() scans the query a single time and returns every
+    entry with at least one keyword in it, most specific first.
+    """
+
+    def __init__(self, entries: List[dict], keywords_field: str = "keywords"):
+        self.entries = entries
+        self.goto: List[Dict[str, int]] = [{}]
+        self.fail: List[int] = [0]
+        self.out: List[List[Tuple[str, int]]] = [[]]  # (keyword, entry index)
+
+        for idx, entry in enumerate(entries):
+            for kw in entry.get(keywords_field, []):
+                kw = (kw or "").strip().lower()
+                if kw:
+                    self._add(kw, idx)
+        self._link()
+
+    def _add(self, keyword: str, entry_idx: int):
+        state = 0
+        for ch in keyword:
+            nxt = self.goto[state].get(ch)
+            if nxt is None:
+                nxt = len(self.goto)
+                self.goto[state][ch] = nxt
+                self.goto.append({})
+                self.fail.append(0)
+                self.out.append([])
+            state = nxt
+        self.out[state].append((keyword, entry_idx))
+
+    def _link(self):
+        queue = deque(self.goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, nxt in self.goto[state].items():
+                queue.append(nxt)
+                f = self.fail[state]
+                while f and ch not in self.goto[f]:
+                    f = self.fail[f]
+                self.fail[nxt] = self.goto[f].get(ch, 0)
+                self.out[nxt] = self.out[nxt] + self.out[self.fail[nxt]]
+
+    def match(self, query: str) -> List[dict]:
+        """
+        Entries whose keywords occur in query, ranked by specificity: each distinct
+        keyword scores its length, doubled when it matches on word boundaries
+        ("label" in "box label" beats "label" in "relabel"). Ties keep file order.
+        """
+        text = (query or "").lower()
+        hits: Dict[Tuple[str, int], int] = {}
+        state = 0
+
+        for pos, ch in enumerate(text):
+            while state and ch not in self.goto[state]:
+                state = self.fail[state]
+            state = self.goto[state].get(ch, 0)
+
+            for keyword, idx in self.out[state]:
+                start, end = pos - len(keyword) + 1, pos + 1
+                whole_word = (start == 0 or not text[start - 1].isalnum()) and (end == len(text) or not text[end].isalnum())
+                score = len(keyword) * (2 if whole_word else 1)
+                hits[(keyword, idx)] = max(hits.get((keyword, idx), 0), score)
+
+        scores: Dict[int, int] = {}
+        for (_, idx), score in hits.items():
+            scores[idx] = scores.get(idx, 0) + score
+
+        ranked = sorted(scores, key=lambda i: (-scores[i], i))
+        return [self.entries[i] for i in ranked]
@@ -0,0 +1,440 @@
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from functools import lru_cache
+from itertools import islice
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+import fitz  # PyMuPDF
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+from utils.embeddings import EMBEDDING_BACKENDS, backend_signature, resolve_backend
+from utils.image_processing import describe_images
+from utils.image_registry import REGISTRY_PATH, load_registry, match_corpus, registry_document
+from utils.sharded_index import ShardedIndex
+
+DOC_DIR = "documents"
+VECTOR_STORE_PATH = "faiss_index"
+MANIFEST_FILE = "manifest.json"
+CHUNK_SIZE = 500
+CHUNK_OVERLAP = 80
+
+TEXT_EXTENSIONS = (".md", ".txt")
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png")
+INDEXED_EXTENSIONS = (".pdf",) + TEXT_EXTENSIONS + IMAGE_EXTENSIONS
+MIN_FILE_SIZE = 16  # bytes; skips placeholders like new.txt / foto.txt
+PDF_PAGES_PER_TASK = 16
+EMBED_BATCH_SIZE = 64
+
+
+# ================= CONTENT-HASH DE-DUPLICATION =================
+def file_sha256(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+@lru_cache(maxsize=4096)
+def _cached_sha256(path: str, mtime_ns: int, size: int) -> str:
+    # mtime/size in the key: rescans (document watcher) only re-hash files that changed
+    return file_sha256(path)
+
+
+def scan_corpus(doc_dir: str = DOC_DIR, min_size: int = MIN_FILE_SIZE) -> List[dict]:
+    """
+    Walks doc_dir and groups indexable files by content hash.
+    Returns one entry per unique blob: the first path (sorted) is the source,
+    the other byte-identical paths are kept as aliases. Files smaller than
+    min_size are skipped.
+    """
+    by_hash = {}
+    for root, _, files in os.walk(doc_dir):
+        for file in files:
+            if not file.lower().endswith(INDEXED_EXTENSIONS):
+                continue
+            path = os.path.join(root, file)
+            stat = os.stat(path)
+            if stat.st_size < min_size:
+                continue
+            digest = _cached_sha256(path, stat.st_mtime_ns, stat.st_size)
+            by_hash.setdefault(digest, []).append(os.path.relpath(path, doc_dir))
+
+    entries = []
+    for digest, rel_paths in by_hash.items():
+        rel_paths.sort()
+        entries.append({
+            "sha256": digest,
+            "source": rel_paths[0],
+            "aliases": rel_paths[1:],
+            "path": os.path.join(doc_dir, rel_paths[0]),
+        })
+    return sorted(entries, key=lambda e: e["source"])
+
+
+# ================= LOAD DOCUMENTS =================
+def _extract_pdf_pages(path: str, start: int, stop: int) -> List[Tuple[int, str]]:
+    """Worker: returns (page_number, text) for pages [start, stop) of a PDF (1-based numbers)."""
+    with fitz.open(path) as pdf:
+        return [(i + 1, pdf[i].get_text()) for i in range(start, min(stop, pdf.page_count))]
+
+
+def iter_documents(doc_dir: str = DOC_DIR, client=None, include_images: bool = True,
+                   workers: Optional[int] = None, registry_path: str = REGISTRY_PATH,
+                   sources: Optional[Iterable[str]] = None) -> Iterator[Document]:
+    """
+    Streams Documents from doc_dir, once per unique file content (see scan_corpus).
+
+    PDFs are extracted page by page on a process pool and yield one Document per
+    page (metadata 'page' / 'total_pages'), as soon as each batch of pages is done
+    (also while text files are read and images are described), so the caller can
+    split and embed while extraction is still running.
+    Images listed in the image registry are indexed from its tags/description;
+    only the others are described with GPT-4o-mini, several per request, on a
+    background thread (when a client is given; without one, offline builds index
+    just their paths). They come last.
+    sources limits the output to those corpus sources (incremental updates).
+    """
+    entries = scan_corpus(doc_dir)
+    registered = {}
+    if include_images:
+        registered = match_corpus(load_registry(registry_path), entries, doc_dir, verbose=sources is None)
+    if sources is not None:
+        sources = set(sources)
+        entries = [e for e in entries if e["source"] in sources]
+        registered = {s: item for s, item in registered.items() if s in sources}
+    unregistered = []
+    pdf_entries = [e for e in entries if e["source"].lower().endswith(".pdf")]
+
+    pool = ProcessPoolExecutor(max_workers=workers) if pdf_entries else None
+    vision = None
+    futures = {}
+
+    def pdf_documents(future) -> Iterator[Document]:
+        entry, total_pages = futures.pop(future)
+        try:
+            pages = future.result()
+        except Exception as e:
+            print(f"Skipping pages of {entry['path']}: {e}")
+            return
+        for page_no, text in pages:
+            if text.strip():
+                yield Document(page_content=text, metadata={
+                    "source": entry["source"], "sha256": entry["sha256"], "aliases": entry["aliases"],
+                    "type": "text", "page": page_no, "total_pages": total_pages,
+                })
+
+    try:
+        # 1) Fan PDF page ranges out to the pool first
+        for entry in pdf_entries:
+            try:
+                with fitz.open(entry["path"]) as pdf:
+                    total_pages = pdf.page_count
+            except Exception as e:
+                print(f"Skipping {entry['path']}: {e}")
+                continue
+            for start in range(0, total_pages, PDF_PAGES_PER_TASK):
+                future = pool.submit(_extract_pdf_pages, entry["path"], start, start + PDF_PAGES_PER_TASK)
+                futures[future] = (entry, total_pages)
+
+        # 2) Text and images in this process while the pool works
+        for entry in entries:
+            path, rel_path = entry["path"], entry["source"]
+            name = rel_path.lower()
+            base_meta = {"source": rel_path, "sha256": entry["sha256"], "aliases": entry["aliases"]}
+
+            try:
+                if name.endswith(TEXT_EXTENSIONS):
+                    with open(path, "r", encoding="utf-8") as f:
+                        text = f.read()
+                    if text.strip():
+                        yield Document(page_content=text, metadata={**base_meta, "type": "text"})
+
+                elif include_images and rel_path in registered:
+                    yield registry_document(registered[rel_path], entry)
+
+                elif include_images and name.endswith(IMAGE_EXTENSIONS):
+                    unregistered.append(entry)
+            except Exception as e:
+                print(f"Skipping {path}: {e}")
+
+            for future in [f for f in futures if f.done()]:
+                yield from pdf_documents(future)
+
+        # 3) Unregistered images: batched vision descriptions on a thread, PDF pages as they complete meanwhile
+        stats = {}
+        descriptions = {}
+        if client and unregistered:
+            vision = ThreadPoolExecutor(max_workers=1)
+            described = vision.submit(describe_images, client, [e["path"] for e in unregistered], stats=stats)
+
+        for future in as_completed(list(futures)):
+            yield from pdf_documents(future)
+
+        # 4) Images, once described
+        if vision:
+            descriptions = described.result()
+        for entry in unregistered:
+            # Description is the searchable content; type='image' tells the UI to show the file
+            content = f"Image related to: {', '.join([entry['source']] + entry['aliases'])}"
+            if descriptions.get(entry["path"]):
+                content += f"\nDescription: {descriptions[entry['path']]}"
+            yield Document(page_content=content, metadata={
+                "source": entry["source"], "sha256": entry["sha256"], "aliases": entry["aliases"],
+                "type": "image", "full_path": entry["path"],
+            })
+        if registered or unregistered:
+            print(f"Images: {len(registered)} from the registry, {len(descriptions)} described by the vision model "
+                  f"in {stats.get('batch_requests', 0) + stats.get('single_requests', 0)} requests")
+    finally:
+        if pool:
+            pool.shutdown(cancel_futures=True)
+        if vision:
+            vision.shutdown(wait=False, cancel_futures=True)
+
+
+def load_documents(doc_dir: str = DOC_DIR, client=None, include_images: bool = True) -> List[Document]:
+    return list(iter_documents(doc_dir, client=client, include_images=include_images))
+
+
+def split_documents(docs: Iterable[Document], chunk_size: int = CHUNK_SIZE, chunk_overlap: int = CHUNK_OVERLAP) -> List[Document]:
+    return list(iter_chunks(docs, chunk_size, chunk_overlap))
+
+
+def iter_chunks(docs: Iterable[Document], chunk_size: int = CHUNK_SIZE, chunk_overlap: int = CHUNK_OVERLAP) -> Iterator[Document]:
+    """Splits documents one at a time, so chunks flow out while documents are still loading."""
+    splitter = RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+    for doc in docs:
+        yield from splitter.split_documents([doc])
+
+
+def format_source(doc: Document) -> str:
+    """'installation/manual.pdf p.12' style label for context blocks and citations."""
+    source = doc.metadata.get("source", "")
+    page = doc.metadata.get("page")
+    return f"{source} p.{page}" if page else source
+
+
+# ================= BUILD / LOAD INDEX =================
+def read_manifest(folder: str) -> dict:
+    path = os.path.join(folder, MANIFEST_FILE)
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def write_manifest(folder: str, **fields):
+    manifest = read_manifest(folder)
+    manifest.update(fields)
+    with open(os.path.join(folder, MANIFEST_FILE), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+
+
+def build_index(chunks: Iterable[Document], backend: Optional[str] = None, folder: Optional[str] = None,
+                batch_size: int = EMBED_BATCH_SIZE, embeddings: Optional[Embeddings] = None) -> Optional[ShardedIndex]:
+    """
+    Embeds chunks into per-category / per-type FAISS + BM25 shards in batches,
+    consuming the iterable lazily (embedding overlaps with a streaming
+    iter_documents/iter_chunks source). Persists the shards and a manifest when
+    folder is given. Returns None when there is nothing to index.
+    embeddings overrides the backend's Embeddings object (e.g. recorded vectors).
+    """
+    index = ShardedIndex(backend, embeddings=embeddings)
+
+    chunks = iter(chunks)
+    while batch := list(islice(chunks, batch_size)):
+        index.add_documents(batch)
+
+    if not len(index):
+        return None
+
+    if folder:
+        if os.path.exists(folder):
+            shutil.rmtree(folder)  # no stale shards from a previous layout
+        os.makedirs(folder)
+        index.save(folder)
+        write_manifest(
+            folder,
+            embedding_backend=backend_signature(backend),
+            version=index.version,
+            shards=sorted(index.shards),
+            n_chunks=len(index),
+            built_at=time.strftime("%Y-%m-%dT%H:%M:%S"),
+        )
+    return index
+
+
+def load_index(folder: str, backend: Optional[str] = None) -> Optional[ShardedIndex]:
+    """
+    Loads a persisted index. Returns None if it is missing, predates sharding or
+    was built with another embedding backend (the vectors would not be comparable).
+    """
+    manifest = read_manifest(folder)
+    if not manifest.get("shards"):
+        return None
+    if manifest.get("embedding_backend") != backend_signature(backend):
+        return None
+    return ShardedIndex.load(folder, manifest["shards"], backend, manifest.get("version"))
+
+
+def update_index(index: ShardedIndex, doc_dir: str = DOC_DIR, folder: Optional[str] = None,
+                 client=None, include_images: bool = True, paths: Optional[Iterable[str]] = None) -> dict:
+    """
+    Incremental refresh: diffs doc_dir against the index by content hash and
+    re-indexes only new / changed sources and drops deleted ones (no full rebuild).
+    paths (relative to doc_dir, e.g. from the document watcher) limits the
+    refresh to those files, plus the copy that takes over a deleted source.
+    Persists the touched shards and the new version when folder is given.
+    Returns a summary; empty when nothing changed.
+    """
+    corpus = {e["source"]: e["sha256"] for e in scan_corpus(doc_dir)
+              if include_images or not e["source"].lower().endswith(IMAGE_EXTENSIONS)}
+    indexed = index.indexed_files()
+    changed = {source for source, digest in corpus.items() if indexed.get(source) != digest}
+    removed = set(indexed) - set(corpus)
+    if paths is not None:
+        paths = {os.path.normpath(p) for p in paths}
+        removed = {s for s in removed if os.path.normpath(s) in paths}
+        moved = {indexed[s] for s in removed}  # same content still indexed under another path
+        changed = {s for s in changed if os.path.normpath(s) in paths or corpus[s] in moved}
+    if not changed and not removed:
+        return {}
+
+    docs = iter_documents(doc_dir, client=client, include_images=include_images, sources=changed)
+    chunks = list(iter_chunks(docs))
+    touched = index.apply_update(changed | removed, chunks)
+
+    if folder:
+        index.save(folder, touched)
+        write_manifest(
+            folder,
+            version=index.version,
+            shards=sorted(index.shards),
+            n_chunks=len(index),
+            updated_at=time.strftime("%Y-%m-%dT%H:%M:%S"),
+        )
+    return {
+        "changed": sorted(changed),
+        "removed": sorted(removed),
+        "chunks": len(chunks),
+        "version": index.version,
+    }
+
+
+# ================= CLI =================
+def benchmark_backends(chunks: List[Document], backends: List[str], query: str, repeat: int = 5) -> List[dict]:
+    """Times index build and query latency per embedding backend (nothing is persisted)."""
+    rows = []
+    for backend in backends:
+        t0 = time.perf_counter()
+        index = build_index(chunks, backend)
+        build_s = time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        for _ in range(repeat):
+            index.search(query, k=4, mode="vector")
+        query_ms = (time.perf_counter() - t0) / repeat * 1000
+
+        rows.append({
+            "backend": backend,
+            "chunks": len(chunks),
+            "build_s": round(build_s, 3),
+            "chunks_per_s": round(len(chunks) / build_s, 1) if build_s else None,
+            "query_ms": round(query_ms, 2),
+        })
+    return rows
+
+
+def _openai_client():
+    key = os.environ.get("OPENAI_API_KEY")
+    if not key:
+        return None
+    from openai import OpenAI
+    return OpenAI(api_key=key)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build, query and benchmark the procedures knowledge base.")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+
+    p_build = sub.add_parser("build", help="Build and persist the FAISS + BM25 index")
+    p_build.add_argument("--backend", choices=EMBEDDING_BACKENDS, default=None)
+    p_build.add_argument("--out", default=VECTOR_STORE_PATH)
+    p_build.add_argument("--no-images", action="store_true", help="Skip image documents")
+
+    p_query = sub.add_parser("query", help="Query a persisted index")
+    p_query.add_argument("text")
+    p_query.add_argument("--backend", choices=EMBEDDING_BACKENDS, default=None)
+    p_query.add_argument("--index", default=VECTOR_STORE_PATH)
+    p_query.add_argument("-k", type=int, default=4)
+
+    p_bench = sub.add_parser("bench", help="Compare build speed of embedding backends")
+    p_bench.add_argument("--backends", nargs="+", choices=EMBEDDING_BACKENDS, default=["local", "openai"])
+    p_bench.add_argument("--query", default="how do I reset the cisco router")
+
+    p_watch = sub.add_parser("watch", help="Keep a persisted index in sync with the documents folder")
+    p_watch.add_argument("--backend", choices=EMBEDDING_BACKENDS, default=None)
+    p_watch.add_argument("--index", default=VECTOR_STORE_PATH)
+    p_watch.add_argument("--no-images", action="store_true", help="Skip image documents")
+
+    for p in (p_build, p_bench, p_watch):
+        p.add_argument("--docs", default=DOC_DIR)
+
+    args = parser.parse_args(argv)
+
+    if args.cmd == "build":
+        backend = resolve_backend(args.backend)
+        client = None if args.no_images else _openai_client()
+        t0 = time.perf_counter()
+        docs = iter_documents(args.docs, client=client, include_images=not args.no_images)
+        index = build_index(iter_chunks(docs), backend, folder=args.out)
+        if index is None:
+            print(f"No documents found in {args.docs}")
+            return 1
+        print(f"Built {len(index)} chunks in {len(index.shards)} shards with '{backend}' "
+              f"in {time.perf_counter() - t0:.2f}s -> {args.out}")
+
+    elif args.cmd == "query":
+        index = load_index(args.index, args.backend)
+        if index is None:
+            print(f"No index for backend '{resolve_backend(args.backend)}' in {args.index}. Run 'build' first.")
+            return 1
+        print(f"Routed to: {', '.join(index.route(args.text))}")
+        for doc in index.search(args.text, k=args.k):
+            print(f"[{format_source(doc)}] {doc.page_content[:120]!r}")
+
+    elif args.cmd == "watch":
+        from utils.doc_watcher import watch_index
+
+        index = load_index(args.index, args.backend)
+        if index is None:
+            print(f"No index for backend '{resolve_backend(args.backend)}' in {args.index}. Run 'build' first.")
+            return 1
+        client = None if args.no_images else _openai_client()
+        print(f"Watching {args.docs} -> {args.index} (index {index.version}). Ctrl+C to stop.")
+        watcher = watch_index(index, args.index, args.docs, client=client, include_images=not args.no_images)
+        try:
+            while watcher.is_alive():
+                watcher.join(1)
+        except KeyboardInterrupt:
+            watcher.stop()
+
+    elif args.cmd == "bench":
+        chunks = split_documents(load_documents(args.docs, include_images=False))
+        for row in benchmark_backends(chunks, args.backends, args.query):
+            print(json.dumps(row))
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,175 @@
+import json
+import math
+import os
+import re
+from collections import Counter
+from typing import Callable, Dict, List, Optional, Tuple
+
+from langchain_core.documents import Document
+
+LEXICAL_INDEX_FILE = "bm25.json"
+RETRIEVAL_MODES = ("hybrid", "vector", "keyword")
+
+# Keeps part codes / serials together ("400-937", "l63", "rdl-1234")
+TOKEN_RE = re.compile(r"[a-z0-9]+(?:[-_/.][a-z0-9]+)*")
+CODE_RE = re.compile(r"^(?=.*\d)[a-z0-9]+(?:[-_/.][a-z0-9]+)*$")
+STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "do", "does", "for", "from",
+    "how", "i", "in", "is", "it", "me", "my", "of", "on", "or", "show", "the",
+    "this", "to", "what", "when", "where", "which", "with",
+}
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercases and splits text, also emitting the parts of compound codes."""
+    tokens = []
+    for tok in TOKEN_RE.findall((text or "").lower()):
+        if tok in STOPWORDS:
+            continue
+        tokens.append(tok)
+        parts = re.split(r"[-_/.]", tok)
+        if len(parts) > 1:
+            tokens.extend(p for p in parts if p and p not in STOPWORDS)
+    return tokens
+
+
+def is_keyword_query(query: str) -> bool:
+    """
+    True for queries that lexical search answers well on its own:
+    part numbers / serials ("L63", "400-937"), quoted phrases or very short lookups.
+    """
+    if '"' in (query or ""):
+        return True
+    words = [w for w in TOKEN_RE.findall((query or "").lower()) if w not in STOPWORDS]
+    if not words:
+        return False
+    if any(CODE_RE.match(w) for w in words):
+        return True
+    return len(words) <= 2
+
+
+class BM25Index:
+    """Small in-process BM25 (Okapi) inverted index over LangChain Documents."""
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.docs: List[Document] = []
+        self.doc_lens: List[int] = []
+        self.postings: Dict[str, Dict[int, int]] = {}
+
+    def __len__(self):
+        return len(self.docs)
+
+    @classmethod
+    def from_documents(cls, docs: List[Document], **kwargs) -> "BM25Index":
+        index = cls(**kwargs)
+        index.add_documents(docs)
+        return index
+
+    def add_documents(self, docs: List[Document]):
+        for doc in docs:
+            doc_id = len(self.docs)
+            counts = Counter(tokenize(doc.page_content))
+            self.docs.append(doc)
+            self.doc_lens.append(sum(counts.values()))
+            for term, tf in counts.items():
+                self.postings.setdefault(term, {})[doc_id] = tf
+
+    def search(self, query: str, k: int = 4) -> List[Tuple[Document, float]]:
+        n_docs = len(self.docs)
+        if not n_docs:
+            return []
+
+        avgdl = (sum(self.doc_lens) / n_docs) or 1.0
+        scores: Dict[int, float] = {}
+
+        for term in set(tokenize(query)):
+            posting = self.postings.get(term)
+            if not posting:
+                continue
+            idf = math.log(1 + (n_docs - len(posting) + 0.5) / (len(posting) + 0.5))
+            for doc_id, tf in posting.items():
+                norm = self.k1 * (1 - self.b + self.b * self.doc_lens[doc_id] / avgdl)
+                scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * (self.k1 + 1) / (tf + norm)
+
+        best = sorted(scores.items(), key=lambda x: x[1], reverse=True)[:k]
+        return [(self.docs[doc_id], score) for doc_id, score in best]
+
+    # ---------- persistence (next to the FAISS files) ----------
+    def save(self, folder: str):
+        os.makedirs(folder, exist_ok=True)
+        payload = {
+            "k1": self.k1,
+            "b": self.b,
+            "docs": [{"page_content": d.page_content, "metadata": d.metadata} for d in self.docs],
+        }
+        with open(os.path.join(folder, LEXICAL_INDEX_FILE), "w", encoding="utf-8") as f:
+            json.dump(payload, f)
+
+    @classmethod
+    def load(cls, folder: str) -> Optional["BM25Index"]:
+        path = os.path.join(folder, LEXICAL_INDEX_FILE)
+        if not os.path.exists(path):
+            return None
+        with open(path, "r", encoding="utf-8") as f:
+            payload = json.load(f)
+        docs = [Document(page_content=d["page_content"], metadata=d["metadata"]) for d in payload["docs"]]
+        return cls.from_documents(docs, k1=payload.get("k1", 1.5), b=payload.get("b", 0.75))
+
+
+def docs_from_faiss(db) -> List[Document]:
+    """Recovers the stored chunks of a FAISS store (used when bm25.json is missing)."""
+    return [db.docstore.search(doc_id) for doc_id in db.index_to_docstore_id.values()]
+
+
+def _doc_key(doc: Document):
+    return (doc.metadata.get("source"), doc.metadata.get("page"), doc.page_content)
+
+
+def reciprocal_rank_fusion(result_lists: List[List[Document]], k: int = 60, top_n: int = 4) -> List[Document]:
+    """Merges ranked lists with RRF: score = sum(1 / (k + rank))."""
+    scores: Dict[tuple, float] = {}
+    by_key: Dict[tuple, Document] = {}
+
+    for results in result_lists:
+        for rank, doc in enumerate(results, start=1):
+            key = _doc_key(doc)
+            by_key.setdefault(key, doc)
+            scores[key] = scores.get(key, 0.0) + 1.0 / (k + rank)
+
+    ranked = sorted(scores, key=scores.get, reverse=True)[:top_n]
+    return [by_key[key] for key in ranked]
+
+
+def hybrid_search(db, lexical: Optional[BM25Index], query: str, k: int = 4, mode: str = "hybrid",
+                  query_vector: Optional[Callable[[], List[float]]] = None) -> List[Document]:
+    """
+    Retrieval entry point shared by the chatbots.
+    - keyword: BM25 only (no embedding call, works offline); without a lexical
+               index it returns nothing rather than falling back to FAISS
+    - vector:  FAISS only
+    - hybrid:  keyword-heavy queries with lexical hits skip the embedding call,
+               everything else fuses FAISS + BM25 with RRF
+    query_vector, if given, returns the query embedding (lets callers searching
+    several stores embed the query once instead of once per store).
+    """
+    def vector_search():
+        if query_vector is None:
+            return db.similarity_search(query, k=k)
+        return db.similarity_search_by_vector(query_vector(), k=k)
+
+    if mode == "keyword" and (lexical is None or not len(lexical)):
+        print("Keyword search skipped: this store has no lexical index (rebuild it to create bm25.json)")
+        return []
+    if mode == "vector" or lexical is None or not len(lexical):
+        return vector_search() if db is not None else []
+
+    lexical_hits = [doc for doc, _ in lexical.search(query, k=k)]
+    if mode == "keyword" or db is None:
+        return lexical_hits
+    if lexical_hits and is_keyword_query(query):
+        return lexical_hits
+
+    vector_hits = vector_search()
+    return reciprocal_rank_fusion([vector_hits, lexical_hits], top_n=k)
@@ -0,0 +1,493 @@
+import argparse
+import io
+import json
+import os
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+
+from utils.embeddings import EMBEDDING_BACKENDS, HashingEmbeddings
+from utils.tracing import percentile
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+PAGES_DIR = os.path.join(ROOT, "pages")
+SHARED_DIRS = ("documents", "config")  # linked into the scratch working directory
+
+QUESTIONS = (
+    "How do I reset the Cisco router?",
+    "Carmanah sign flashing decimal points",
+    "Which port does the Admart transceiver use?",
+    "How do I restore the accounting NVRAM after an SST move?",
+    "How many WJS units must I sign out?",
+)
+RECEIPT_JSON = {
+    "date": "2026-01-15", "merchant": "Stub Diner", "category": "Trip Meals", "currency": "CAD",
+    "receipt_total": 23.45, "possible_excluded_items": [], "notes": "",
+}
+
+
+# ================= OPENAI STUB =================
+class OpenAIStub:
+    """
+    Minimal OpenAI-compatible HTTP server (chat completions + embeddings) with a
+    fixed artificial latency. Pages reach it through OPENAI_BASE_URL.
+    """
+
+    def __init__(self, latency_ms: float = 300, dim: int = 1536):
+        self.latency_ms = latency_ms
+        self.embedder = HashingEmbeddings(dim=dim)
+        self.calls = 0
+        self._lock = threading.Lock()
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self.server.daemon_threads = True
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self.server.server_address[1]}/v1"
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+                with stub._lock:
+                    stub.calls += 1
+                time.sleep(stub.latency_ms / 1000)
+
+                if self.path.endswith("/embeddings"):
+                    inputs = body.get("input", [])
+                    inputs = inputs if isinstance(inputs, list) else [inputs]
+                    payload = {
+                        "object": "list",
+                        "model": body.get("model", "stub"),
+                        "data": [{"object": "embedding", "index": i, "embedding": stub.embedder.embed_query(str(t))}
+                                 for i, t in enumerate(inputs)],
+                        "usage": {"prompt_tokens": 0, "total_tokens": 0},
+                    }
+                elif self.path.endswith("/chat/completions"):
+                    wants_json = (body.get("response_format") or {}).get("type") == "json_object"
+                    content = json.dumps(RECEIPT_JSON) if wants_json else (
+                        "1. Press the black reset button on the back of the Cisco router.\n"
+                        "2. Wait 30 seconds, then press it again. (troubleshooting/wjs_troubleshooting_guide.md)"
+                    )
+                    payload = {
+                        "id": "chatcmpl-stub", "object": "chat.completion", "created": int(time.time()),
+                        "model": body.get("model", "stub"),
+                        "choices": [{"index": 0, "finish_reason": "stop",
+                                     "message": {"role": "assistant", "content": content}}],
+                        "usage": {"prompt_tokens": 100, "completion_tokens": 40, "total_tokens": 140},
+                    }
+                else:
+                    self.send_error(404)
+                    return
+
+                data = json.dumps(payload).encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+        return Handler
+
+    def __enter__(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+
+
+# ================= SERVER =================
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+class StreamlitServer:
+    """
+    One real `streamlit run <page>` process, the way the app is deployed: every
+    virtual session connects to it over the websocket, so they share its
+    caches, its database pool and its GIL.
+    """
+
+    def __init__(self, page: str, workdir: str, backend: str, openai_base_url: str, startup_timeout: float = 60):
+        self.page = page
+        self.workdir = workdir
+        self.port = _free_port()
+        self.startup_timeout = startup_timeout
+        self.env = {**os.environ, "OPENAI_BASE_URL": openai_base_url,
+                    "PYTHONPATH": os.pathsep.join(filter(None, [ROOT, os.environ.get("PYTHONPATH")]))}
+        os.makedirs(os.path.join(workdir, ".streamlit"), exist_ok=True)
+        with open(os.path.join(workdir, ".streamlit", "secrets.toml"), "w", encoding="utf-8") as f:
+            f.write(f'OPENAI_API_KEY = "stub-key"\nEMBEDDING_BACKEND = "{backend}"\n')
+        self.process: Optional[subprocess.Popen] = None
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.port}"
+
+    def __enter__(self):
+        self.log = open(os.path.join(self.workdir, "server.log"), "ab")
+        self.process = subprocess.Popen([
+            sys.executable, "-m", "streamlit", "run", os.path.join(PAGES_DIR, self.page),
+            "--server.headless", "true", "--server.port", str(self.port), "--server.address", "127.0.0.1",
+            "--server.fileWatcherType", "none", "--server.enableXsrfProtection", "false",
+            "--browser.gatherUsageStats", "false",
+        ], cwd=self.workdir, env=self.env, stdout=self.log, stderr=subprocess.STDOUT)
+
+        deadline = time.time() + self.startup_timeout
+        while time.time() < deadline:
+            if self.process.poll() is not None:
+                raise RuntimeError(f"streamlit exited with {self.process.returncode} (see server.log)")
+            try:
+                urllib.request.urlopen(f"{self.url}/_stcore/health", timeout=1).read()
+                return self
+            except OSError:
+                time.sleep(0.2)
+        self.__exit__()
+        raise RuntimeError(f"streamlit did not answer within {self.startup_timeout:.0f}s")
+
+    def __exit__(self, *exc):
+        if self.process and self.process.poll() is None:
+            self.process.terminate()
+            try:
+                self.process.wait(10)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+        self.log.close()
+
+    def cpu_s(self) -> float:
+        """CPU seconds used by the server process so far (Linux /proc)."""
+        with open(f"/proc/{self.process.pid}/stat") as f:
+            fields = f.read().rsplit(")", 1)[1].split()
+        return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+
+    def rss_mb(self) -> float:
+        with open(f"/proc/{self.process.pid}/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+
+
+# ================= HEADLESS CLIENT =================
+class Session:
+    """
+    One virtual user: a websocket session on the server, speaking the browser's
+    protocol (BackMsg rerun requests with widget states, ForwardMsg deltas back).
+    The deltas of each run are parsed with AppTest's element tree, so widgets
+    are found by key the same way; rerun_ms is the time from the request to the
+    end of the script run as the browser would see it (including st.rerun()).
+    """
+
+    def __init__(self, server: StreamlitServer, sid: int, timeout: float):
+        from websockets.sync.client import connect
+
+        self.sid = sid
+        self.server = server
+        self.timeout = timeout
+        self.rerun_ms: List[float] = []
+        self.session_id = None
+        self.at = None  # element tree of the last run
+        self.ws = connect(f"ws://127.0.0.1:{server.port}/_stcore/stream", subprotocols=["streamlit"],
+                          max_size=None, open_timeout=timeout)
+
+    def close(self):
+        self.ws.close()
+
+    def _recv(self):
+        from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+
+        msg = ForwardMsg()
+        msg.ParseFromString(self.ws.recv(timeout=self.timeout))
+        return msg
+
+    def run(self, *states):
+        """Reruns the page with the given widget states (what the browser sends) and times it."""
+        from streamlit.proto.BackMsg_pb2 import BackMsg
+        from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+        from streamlit.testing.v1.element_tree import parse_tree_from_messages
+
+        back = BackMsg()
+        back.rerun_script.SetInParent()
+        back.rerun_script.widget_states.widgets.extend(states)
+        t0 = time.perf_counter()
+        self.ws.send(back.SerializeToString())
+        messages = []
+        while True:
+            msg = self._recv()
+            kind = msg.WhichOneof("type")
+            if kind == "new_session":  # start of a script run (again after st.rerun())
+                self.session_id = msg.new_session.initialize.session_id or self.session_id
+                messages = []
+            messages.append(msg)
+            if kind == "script_finished" and msg.script_finished != ForwardMsg.FINISHED_EARLY_FOR_RERUN:
+                break
+        self.rerun_ms.append((time.perf_counter() - t0) * 1000)
+        self.at = parse_tree_from_messages(messages)
+        if self.at.exception:
+            raise RuntimeError(self.at.exception[0].message)
+        return self.at
+
+    def widget(self, kind: str, key: Optional[str] = None, label: Optional[str] = None):
+        if key is not None:
+            return getattr(self.at, kind)(key=key)
+        return next(w for w in getattr(self.at, kind) if w.label.startswith(label))
+
+    def set(self, kind: str, key: str, value):
+        return self.run(widget_state(self.widget(kind, key), value))
+
+    def click(self, key: Optional[str] = None, label: Optional[str] = None):
+        return self.run(widget_state(self.widget("button", key, label), True))
+
+    def chat(self, text: str):
+        return self.run(widget_state(self.at.chat_input[0], text))
+
+    def upload(self, key: str, files: Dict[str, bytes]):
+        """Uploads files the way the browser does (file URLs, HTTP PUT), then reruns with the uploader state."""
+        import requests
+        from streamlit.proto.BackMsg_pb2 import BackMsg
+
+        uploader = next(w for w in self.at.get("file_uploader") if w.key == key)
+        back = BackMsg()
+        back.file_urls_request.request_id = uuid.uuid4().hex
+        back.file_urls_request.file_names.extend(files)
+        back.file_urls_request.session_id = self.session_id
+        self.ws.send(back.SerializeToString())
+        while True:
+            msg = self._recv()
+            if msg.WhichOneof("type") == "file_urls_response" \
+                    and msg.file_urls_response.response_id == back.file_urls_request.request_id:
+                break
+
+        state = widget_state(uploader, None)
+        for (name, data), urls in zip(files.items(), msg.file_urls_response.file_urls):
+            url = urls.upload_url if urls.upload_url.startswith("http") else self.server.url + urls.upload_url
+            requests.put(url, files={"file": (name, data)}, timeout=self.timeout).raise_for_status()
+            info = state.file_uploader_state_value.uploaded_file_info.add()
+            info.file_id, info.name, info.size = urls.file_id, name, len(data)
+            info.file_urls.CopyFrom(urls)
+        return self.run(state)
+
+
+def widget_state(node, value):
+    """The WidgetState the browser sends after the user sets node to value (labels for radio/selectbox)."""
+    from streamlit.proto.WidgetStates_pb2 import WidgetState
+
+    state = WidgetState(id=node.proto.id)
+    if node.type in ("radio", "selectbox"):
+        if value not in node.options:
+            raise ValueError(f"{value!r} is not an option of {node.proto.id}")
+        state.string_value = value
+    elif node.type == "button":
+        state.trigger_value = True
+    elif node.type == "chat_input":
+        state.chat_input_value.data = value
+    elif node.type in ("checkbox", "toggle"):
+        state.bool_value = value
+    elif node.type == "file_uploader":
+        state.file_uploader_state_value.SetInParent()  # files are added by Session.upload
+    else:
+        state.string_value = value
+    return state
+
+
+# ================= FLOWS =================
+def chat_flow(s: Session, iterations: int):
+    s.run()
+    for i in range(iterations):
+        s.chat(QUESTIONS[(s.sid + i) % len(QUESTIONS)])
+
+
+def inventory_flow(s: Session, iterations: int):
+    tech, item_type = f"Load Tech {s.sid}", f"Load Type {s.sid % 3}"
+    s.run()
+    s.set("radio", "inv_tab", "👤 Technicians")
+    s.set("text_input", "tech_add_name", tech)
+    s.click("btn_save_tech")
+    s.set("radio", "inv_tab", "📦 Item Types")
+    s.set("text_input", "type_add_name", item_type)
+    s.click("btn_save_type")  # may already exist: page shows an error, not an exception
+    s.set("radio", "inv_tab", "🚚 Quick Issue (Scan → Assign)")
+
+    for i in range(iterations):
+        serial = f"LT{s.sid:04d}{i:04d}{random.randint(0, 9999):04d}"
+        s.set("selectbox", "qi_tech_pick", tech)
+        s.set("selectbox", "qi_type_pick", item_type)
+        # "scan": the scanner writes the serial field (its key changes after every save)
+        sn_key = next(w.key for w in s.at.text_input if (w.key or "").startswith("qi_sn_input_"))
+        s.set("text_input", sn_key, serial)
+        s.click("btn_qi_save_assign")
+
+
+def _receipt_png(seed: int) -> bytes:
+    from PIL import Image
+
+    out = io.BytesIO()
+    Image.new("RGB", (64, 64), (seed * 7 % 256, seed * 13 % 256, seed * 29 % 256)).save(out, "PNG")
+    return out.getvalue()
+
+
+def receipts_flow(s: Session, iterations: int):
+    # Real uploads; the page's own (stubbed) OpenAI extraction is part of the analyze rerun
+    s.run()
+    files = {f"receipt_{s.sid}_{i}.png": _receipt_png(s.sid * 1000 + i) for i in range(iterations)}
+    s.upload("expense_receipt_uploader", files)
+    s.click(label="🤖 Analyze")
+    s.click(label="📄 Generate")
+    if not s.at.get("download_button"):
+        raise RuntimeError("no Word report was generated")
+
+
+FLOWS: Dict[str, tuple] = {
+    "chat": ("ChatBot.py", chat_flow),
+    "inventory": ("Tech Inventory.py", inventory_flow),
+    "receipts": ("Expense_Report.py", receipts_flow),
+}
+
+
+# ================= RUNNER =================
+# All sessions of a level run as threads of this process against one server.
+# The client side only sends small protobuf messages and parses the deltas, so
+# the latency it measures is the server's (queueing on its GIL, shared caches,
+# SQLite locks) plus the stubbed OpenAI calls the pages make.
+def _run_session(server: StreamlitServer, flow_name: str, sid: int, iterations: int, timeout: float,
+                 start: threading.Barrier) -> dict:
+    session, error = None, None
+    try:
+        session = Session(server, sid, timeout)
+        start.wait(timeout)
+        FLOWS[flow_name][1](session, iterations)
+    except Exception as e:
+        if start.n_waiting:
+            start.abort()
+        error = f"{type(e).__name__}: {e}"
+    finally:
+        if session:
+            session.close()
+    return {"rerun_ms": session.rerun_ms if session else [], "error": error}
+
+
+def run_level(server: StreamlitServer, flow_name: str, sessions: int, iterations: int, timeout: float) -> dict:
+    start = threading.Barrier(sessions + 1)  # every session connected before the clock starts
+    with ThreadPoolExecutor(max_workers=sessions) as pool:
+        futures = [pool.submit(_run_session, server, flow_name, sid, iterations, timeout, start)
+                   for sid in range(sessions)]
+        try:
+            start.wait(timeout)
+        except threading.BrokenBarrierError:
+            pass
+        t0, cpu0 = time.perf_counter(), server.cpu_s()
+        results = [f.result() for f in futures]
+        wall_s, cpu_s = time.perf_counter() - t0, server.cpu_s() - cpu0
+
+    latencies = [ms for r in results for ms in r["rerun_ms"]]
+    errors = [r["error"] for r in results if r["error"]]
+    return {
+        "flow": flow_name,
+        "sessions": sessions,
+        "reruns": len(latencies),
+        "p50_ms": round(percentile(latencies, 50) or 0, 1),
+        "p95_ms": round(percentile(latencies, 95) or 0, 1),
+        "p99_ms": round(percentile(latencies, 99) or 0, 1),
+        "max_ms": round(max(latencies, default=0), 1),
+        "wall_s": round(wall_s, 2),
+        "reruns_per_s": round(len(latencies) / wall_s, 1) if wall_s > 0 else None,
+        # server CPU-seconds per wall second: close to 1.0 the (GIL-bound) process is saturated
+        "server_cpu_busy": round(cpu_s / wall_s, 2) if wall_s > 0 else None,
+        "server_rss_mb": round(server.rss_mb(), 1),
+        "errors": len(errors),
+        "first_error": errors[0] if errors else None,
+    }
+
+
+def _print_row(row: dict):
+    print(f"{row['flow']:>9}  sessions={row['sessions']:<4} reruns={row['reruns']:<5} "
+          f"p50={row['p50_ms']:>8.1f}ms  p95={row['p95_ms']:>8.1f}ms  p99={row['p99_ms']:>8.1f}ms  "
+          f"reruns/s={row['reruns_per_s']}  server cpu={row['server_cpu_busy']}  "
+          f"server rss={row['server_rss_mb']:.0f}MB  errors={row['errors']}", flush=True)
+
+
+def ramp(server: StreamlitServer, flow_name: str, args):
+    """Raises the number of concurrent sessions until p95 exceeds the SLO or sessions fail."""
+    warm = run_level(server, flow_name, 1, 1, args.timeout)  # builds indexes / tables, fills caches
+    if warm["errors"]:
+        print(f"{flow_name}: warm-up failed: {warm['first_error']}", file=sys.stderr)
+        return
+
+    capacity = None
+    for level in args.levels:
+        row = run_level(server, flow_name, level, args.iterations, args.timeout)
+        row["passed"] = not row["errors"] and row["p95_ms"] <= args.slo_ms
+        if args.json:
+            print(json.dumps(row), flush=True)
+        else:
+            _print_row(row)
+        if not row["passed"]:
+            reason = row["first_error"] or f"p95 {row['p95_ms']:.0f} ms > SLO {args.slo_ms:.0f} ms"
+            print(f"{flow_name}: failure point at {level} concurrent sessions ({reason})", file=sys.stderr)
+            break
+        capacity = level
+    print(f"{flow_name}: one server handles {capacity or 0} concurrent sessions within p95 <= {args.slo_ms:.0f} ms",
+          file=sys.stderr)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Ramp concurrent sessions against one `streamlit run` server per page and find where it fails.")
+    parser.add_argument("--flows", nargs="+", choices=sorted(FLOWS), default=sorted(FLOWS))
+    parser.add_argument("--levels", nargs="+", type=int, default=[1, 2, 4, 8, 16, 32])
+    parser.add_argument("--iterations", type=int, default=3, help="Questions / scans / receipts per session")
+    parser.add_argument("--slo-ms", type=float, default=3000, help="A level fails when p95 rerun latency exceeds this")
+    parser.add_argument("--stub-latency-ms", type=float, default=300, help="Simulated OpenAI response time")
+    parser.add_argument("--backend", choices=EMBEDDING_BACKENDS, default="local")
+    parser.add_argument("--timeout", type=float, default=120, help="Seconds before a single rerun counts as failed")
+    parser.add_argument("--workdir", default=None, help="Where faiss_index / inventory.db are created (default: temp dir)")
+    parser.add_argument("--json", action="store_true")
+    args = parser.parse_args(argv)
+
+    try:
+        import websockets  # noqa: F401
+    except ImportError:
+        print("The load test needs the websockets package (pip install websockets)")
+        return 1
+
+    workdir = os.path.abspath(args.workdir or tempfile.mkdtemp(prefix="orcs_load_"))
+    os.makedirs(workdir, exist_ok=True)
+    for name in SHARED_DIRS:
+        link = os.path.join(workdir, name)
+        if not os.path.exists(link):
+            os.symlink(os.path.join(ROOT, name), link)
+
+    with OpenAIStub(args.stub_latency_ms) as stub:
+        print(f"OpenAI stub at {stub.base_url} ({args.stub_latency_ms:.0f} ms) · workdir {workdir}", file=sys.stderr)
+
+        for flow_name in args.flows:
+            try:
+                with StreamlitServer(FLOWS[flow_name][0], workdir, args.backend, stub.base_url) as server:
+                    ramp(server, flow_name, args)
+            except RuntimeError as e:
+                print(f"{flow_name}: {e}", file=sys.stderr)
+
+        print(f"OpenAI stub calls: {stub.calls}", file=sys.stderr)
+
+    if not args.workdir:
+        shutil.rmtree(workdir, ignore_errors=True)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,160 @@
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from itertools import product
+from typing import List, Optional
+
+from langchain_core.documents import Document
+
+from utils.embeddings import EMBEDDING_BACKENDS, RecordedEmbeddings, backend_signature, get_embeddings, resolve_backend
+from utils.knowledge_base import CHUNK_OVERLAP, CHUNK_SIZE, DOC_DIR, build_index, load_documents, split_documents
+from utils.lexical_index import RETRIEVAL_MODES
+from utils.tracing import percentile
+
+GOLDEN_SET_PATH = os.path.join("config", "retrieval_golden_set.json")
+RECORDINGS_DIR = os.path.join(".cache", "embeddings")
+
+
+def load_golden_set(path: str = GOLDEN_SET_PATH) -> dict:
+    """{'version': int, 'queries': [{'question', 'source', 'contains'}]}"""
+    with open(path, "r", encoding="utf-8") as f:
+        golden = json.load(f)
+    for q in golden["queries"]:
+        if not q.get("question") or not q.get("source"):
+            raise ValueError(f"Golden set entry needs 'question' and 'source': {q}")
+    return golden
+
+
+def _normalise(text: str) -> str:
+    return " ".join(text.lower().split())
+
+
+def is_relevant(doc: Document, expected: dict) -> bool:
+    """Same source file (or one of its aliases) and, if given, the chunk contains the expected step."""
+    sources = [doc.metadata.get("source")] + list(doc.metadata.get("aliases") or [])
+    if expected["source"] not in sources:
+        return False
+    contains = expected.get("contains")
+    return not contains or _normalise(contains) in _normalise(doc.page_content)
+
+
+def first_relevant_rank(results: List[Document], expected: dict) -> Optional[int]:
+    for rank, doc in enumerate(results, start=1):
+        if is_relevant(doc, expected):
+            return rank
+    return None
+
+
+def _dir_size(folder: str) -> int:
+    return sum(os.path.getsize(os.path.join(root, f)) for root, _, files in os.walk(folder) for f in files)
+
+
+def evaluate(docs: List[Document], golden: dict, chunk_size: int, chunk_overlap: int,
+             ks: List[int], modes: List[str], backend: str, embeddings=None) -> List[dict]:
+    """Builds one index for (chunk_size, chunk_overlap) and scores every (mode, k) against the golden set."""
+    chunks = split_documents(docs, chunk_size, chunk_overlap)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        folder = os.path.join(tmp, "index")
+        t0 = time.perf_counter()
+        index = build_index(chunks, backend, folder=folder, embeddings=embeddings)
+        build_s = time.perf_counter() - t0
+        size_kb = _dir_size(folder) / 1024
+
+    rows = []
+    for mode, k in product(modes, ks):
+        ranks, latencies = [], []
+        for q in golden["queries"]:
+            t0 = time.perf_counter()
+            results = index.search(q["question"], k=k, mode=mode, k_images=0)
+            latencies.append((time.perf_counter() - t0) * 1000)
+            ranks.append(first_relevant_rank(results, q))
+
+        hits = [r for r in ranks if r is not None]
+        rows.append({
+            "golden_version": golden.get("version"),
+            "backend": backend,
+            "chunk_size": chunk_size,
+            "chunk_overlap": chunk_overlap,
+            "mode": mode,
+            "k": k,
+            "chunks": len(chunks),
+            "recall@k": round(len(hits) / len(ranks), 3),
+            "mrr": round(sum(1 / r for r in hits) / len(ranks), 3),
+            "build_s": round(build_s, 3),
+            "index_kb": round(size_kb, 1),
+            "query_p50_ms": round(percentile(latencies, 50), 2),
+            "query_p95_ms": round(percentile(latencies, 95), 2),
+            "missed": [q["question"] for q, r in zip(golden["queries"], ranks) if r is None],
+        })
+    return rows
+
+
+def _print_table(rows: List[dict]):
+    cols = ["chunk_size", "chunk_overlap", "mode", "k", "chunks", "recall@k", "mrr",
+            "build_s", "index_kb", "query_p50_ms", "query_p95_ms"]
+    widths = {c: max(len(c), *(len(str(r[c])) for r in rows)) for c in cols}
+    print("  ".join(c.rjust(widths[c]) for c in cols))
+    for r in rows:
+        print("  ".join(str(r[c]).rjust(widths[c]) for c in cols))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Score retrieval (recall@k, MRR) and measure build/query cost for several chunking configs.")
+    parser.add_argument("--golden", default=GOLDEN_SET_PATH)
+    parser.add_argument("--docs", default=DOC_DIR)
+    parser.add_argument("--chunk-sizes", nargs="+", type=int, default=[300, CHUNK_SIZE, 800])
+    parser.add_argument("--overlaps", nargs="+", type=int, default=[0, CHUNK_OVERLAP])
+    parser.add_argument("-k", nargs="+", type=int, default=[1, 3, 4])
+    parser.add_argument("--modes", nargs="+", choices=RETRIEVAL_MODES, default=list(RETRIEVAL_MODES))
+    parser.add_argument("--backend", choices=EMBEDDING_BACKENDS, default="local",
+                        help="'local' runs fully offline; other backends need --recorded or network access")
+    parser.add_argument("--recorded", nargs="?", const="", default=None,
+                        help="Replay embeddings from a JSON recording (default path per backend under .cache/embeddings)")
+    parser.add_argument("--record", action="store_true", help="With --recorded: embed and store missing texts")
+    parser.add_argument("--json", action="store_true", help="Print one JSON row per result instead of a table")
+    args = parser.parse_args(argv)
+
+    backend = resolve_backend(args.backend)
+    golden = load_golden_set(args.golden)
+    docs = load_documents(args.docs, include_images=False)
+    if not docs:
+        print(f"No documents found in {args.docs}")
+        return 1
+
+    embeddings = None
+    if args.recorded is not None:
+        path = args.recorded or os.path.join(RECORDINGS_DIR, f"{backend_signature(backend)}.json")
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        embeddings = RecordedEmbeddings(path, inner=get_embeddings(backend) if args.record else None,
+                                        record=args.record)
+
+    rows = []
+    try:
+        for chunk_size, overlap in product(args.chunk_sizes, args.overlaps):
+            if overlap >= chunk_size:
+                continue
+            rows.extend(evaluate(docs, golden, chunk_size, overlap, args.k, args.modes, backend, embeddings))
+    except KeyError as e:
+        print(e.args[0])
+        return 1
+
+    if embeddings is not None and embeddings.misses:
+        embeddings.save()
+        print(f"Recorded {embeddings.misses} new embeddings -> {embeddings.path}", file=sys.stderr)
+
+    if args.json:
+        for row in rows:
+            print(json.dumps(row))
+    else:
+        print(f"Golden set v{golden.get('version')} · {len(golden['queries'])} questions · backend '{backend}'")
+        _print_table(rows)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,287 @@
+import os
+import re
+import shutil
+import threading
+import time
+from collections import Counter
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from langchain_community.vectorstores import FAISS
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+
+from utils.embeddings import get_embeddings
+from utils.image_registry import TagIndex
+from utils.lexical_index import BM25Index, docs_from_faiss, hybrid_search, reciprocal_rank_fusion, tokenize
+
+GENERAL_CATEGORY = "general"
+IMAGE_RESULTS = 2  # image hits get their own slots instead of competing with text steps
+
+# Aliases per category (the part of the shard key before '/', see doc_category),
+# matched on whole query tokens: 'word', 'stem*' (any token starting with stem) or
+# 'two words' (consecutive tokens). Every category also answers to its own name.
+CATEGORY_KEYWORDS = {
+    "installation": ("install*", "mount*", "height", "bracket*", "chain", "steel cable", "hang", "hanging",
+                     "placement", "training mode"),
+    "troubleshooting": ("troubleshoot*", "error*", "flashing", "decimal*", "no power", "not working", "not receiving",
+                        "reset", "led", "leds", "offline", "blank", "fault*", "power-cycle", "replace"),
+    "inventory": ("inventory", "sign out", "sign-out", "box label", "serial*", "model*", "warehouse", "quantity"),
+    "sst": ("sst", "relocat*", "kiosk*", "backup", "debug", "accounting", "cpu"),
+}
+
+
+def doc_category(source: str) -> str:
+    """
+    Category from the path under documents/: 'troubleshooting/x.md' -> 'troubleshooting',
+    'images/SST Relocation/y.jpg' -> 'sst', files at the top level -> 'general'.
+    """
+    parts = (source or "").replace("\\", "/").split("/")
+    if parts and parts[0].lower() == "images":
+        parts = parts[1:]
+    if len(parts) < 2:
+        return GENERAL_CATEGORY
+    return re.split(r"[\s_-]+", parts[0].strip().lower())[0] or GENERAL_CATEGORY
+
+
+def shard_key(doc: Document) -> str:
+    doc_type = "image" if doc.metadata.get("type") == "image" else "text"
+    return f"{doc_category(doc.metadata.get('source', ''))}/{doc_type}"
+
+
+class CategoryRouter:
+    """
+    Index of the categories' names and aliases, built once per set of shards.
+    A query is scored with lookups of its tokens (and their prefixes / n-grams),
+    so routing cost does not grow with the number of shards or documents.
+    """
+
+    def __init__(self, categories: Iterable[str]):
+        self.words: Dict[str, Set[str]] = {}
+        self.stems: Dict[str, Set[str]] = {}
+        self.phrases: Dict[str, Set[str]] = {}
+        for category in categories:
+            for alias in (category, *CATEGORY_KEYWORDS.get(category, ())):
+                alias = alias.lower()
+                if alias.endswith("*"):
+                    self.stems.setdefault(alias[:-1], set()).add(category)
+                elif " " in alias:
+                    self.phrases.setdefault(" ".join(alias.split()), set()).add(category)
+                else:
+                    self.words.setdefault(alias, set()).add(category)
+        self.phrase_lengths = {len(p.split()) for p in self.phrases}
+
+    def route(self, query: str) -> List[str]:
+        """Categories with at least one alias in the query, most matches first."""
+        tokens = tokenize(query)
+        matched: Set[Tuple[str, str]] = set()  # (category, alias), each alias counts once
+
+        for token in tokens:
+            for category in self.words.get(token, ()):
+                matched.add((category, token))
+            for i in range(1, len(token) + 1):
+                for category in self.stems.get(token[:i], ()):
+                    matched.add((category, token[:i] + "*"))
+        for n in self.phrase_lengths:
+            for i in range(len(tokens) - n + 1):
+                phrase = " ".join(tokens[i:i + n])
+                for category in self.phrases.get(phrase, ()):
+                    matched.add((category, phrase))
+
+        scores = Counter(category for category, _ in matched)
+        return [category for category, _ in scores.most_common()]
+
+
+def _new_version() -> str:
+    return time.strftime("%Y%m%d%H%M%S") + f"{int(time.time() * 1000) % 1000:03d}"
+
+
+def _shard_dir(folder: str, key: str) -> str:
+    return os.path.join(folder, key.replace("/", "__"))
+
+
+class ShardedIndex:
+    """
+    One FAISS + BM25 pair per (category, type) shard, e.g. 'troubleshooting/text'
+    or 'installation/image'. Queries are routed to the relevant categories only and
+    text and image shards are searched separately, then merged.
+    """
+
+    def __init__(self, backend: Optional[str] = None, version: Optional[str] = None,
+                 embeddings: Optional[Embeddings] = None):
+        self.backend = backend
+        self.version = version or _new_version()  # identifies the build in traces / caches
+        self.embeddings = embeddings or get_embeddings(backend)
+        self.shards: Dict[str, Tuple[FAISS, BM25Index]] = {}
+        self.tags = TagIndex()  # registry images, for exact tag hits
+        self.lock = threading.Lock()  # serialises live updates (searches don't take it)
+        self._router: Optional[Tuple[dict, CategoryRouter]] = None  # (shards it was built for, router)
+
+    def __len__(self):
+        return sum(len(lexical) for _, lexical in self.shards.values())
+
+    @property
+    def categories(self) -> List[str]:
+        return sorted({key.split("/")[0] for key in self.shards})
+
+    def add_documents(self, chunks: Iterable[Document]):
+        groups: Dict[str, List[Document]] = {}
+        for chunk in chunks:
+            groups.setdefault(shard_key(chunk), []).append(chunk)
+
+        for key, docs in groups.items():
+            if key in self.shards:
+                db, lexical = self.shards[key]
+                db.add_documents(docs)
+            else:
+                db, lexical = FAISS.from_documents(docs, self.embeddings), BM25Index()
+                self.shards[key] = (db, lexical)
+            lexical.add_documents(docs)
+            if key.endswith("/image"):
+                self.tags.add_documents(docs)
+        self._router = None
+
+    def _copy_shard(self, key: str) -> Tuple[FAISS, BM25Index]:
+        db, lexical = self.shards[key]
+        db = FAISS.deserialize_from_bytes(db.serialize_to_bytes(), self.embeddings,
+                                          allow_dangerous_deserialization=True)
+        return db, BM25Index.from_documents(list(lexical.docs), k1=lexical.k1, b=lexical.b)
+
+    def apply_update(self, remove_sources: Set[str], chunks: List[Document]) -> Set[str]:
+        """
+        Live update while the index is being searched: drops every chunk of
+        remove_sources and adds chunks. Touched shards are copied, changed and
+        swapped in, so searches never see a half-applied update and need no lock.
+        Bumps version. Returns the shard keys touched (emptied shards are dropped).
+        """
+        groups: Dict[str, List[Document]] = {}
+        for chunk in chunks:
+            groups.setdefault(shard_key(chunk), []).append(chunk)
+
+        with self.lock:
+            shards = dict(self.shards)
+            touched = set(groups)
+
+            for key, (db, lexical) in self.shards.items():
+                ids = [doc_id for doc_id in db.index_to_docstore_id.values()
+                       if db.docstore.search(doc_id).metadata.get("source") in remove_sources]
+                if not ids:
+                    continue
+                touched.add(key)
+                db, lexical = shards[key] = self._copy_shard(key)
+                db.delete(ids)
+                lexical.docs = [d for d in lexical.docs if d.metadata.get("source") not in remove_sources]
+                shards[key] = (db, BM25Index.from_documents(lexical.docs, k1=lexical.k1, b=lexical.b))
+
+            for key, docs in groups.items():
+                if key not in shards:
+                    shards[key] = (FAISS.from_documents(docs, self.embeddings), BM25Index.from_documents(docs))
+                    continue
+                if shards[key] is self.shards.get(key):
+                    shards[key] = self._copy_shard(key)
+                db, lexical = shards[key]
+                db.add_documents(docs)
+                lexical.add_documents(docs)
+
+            shards = {key: shard for key, shard in shards.items() if len(shard[1])}
+            tags = self.tags
+            if any(key.endswith("/image") for key in touched):
+                tags = TagIndex()
+                for key, (_, lexical) in shards.items():
+                    if key.endswith("/image"):
+                        tags.add_documents(lexical.docs)
+
+            self.shards, self.tags = shards, tags
+            self.version = _new_version()
+        return touched
+
+    def indexed_files(self) -> Dict[str, str]:
+        """{source: sha256} of everything in the index."""
+        return {d.metadata.get("source"): d.metadata.get("sha256")
+                for _, lexical in self.shards.values() for d in lexical.docs}
+
+    # ---------- persistence ----------
+    def save(self, folder: str, keys: Optional[Iterable[str]] = None):
+        """Writes all shards, or only `keys` (shards that no longer exist are deleted from disk)."""
+        shards = self.shards
+        for key in (shards if keys is None else keys):
+            if key in shards:
+                db, lexical = shards[key]
+                db.save_local(_shard_dir(folder, key))
+                lexical.save(_shard_dir(folder, key))
+            elif os.path.exists(_shard_dir(folder, key)):
+                shutil.rmtree(_shard_dir(folder, key))
+
+    @classmethod
+    def load(cls, folder: str, keys: List[str], backend: Optional[str] = None,
+             version: Optional[str] = None) -> "ShardedIndex":
+        index = cls(backend, version)
+        for key in keys:
+            path = _shard_dir(folder, key)
+            db = FAISS.load_local(path, index.embeddings, allow_dangerous_deserialization=True)
+            lexical = BM25Index.load(path)
+            if lexical is None:
+                lexical = BM25Index.from_documents(docs_from_faiss(db))
+                lexical.save(path)
+            index.shards[key] = (db, lexical)
+            if key.endswith("/image"):
+                index.tags.add_documents(docs_from_faiss(db))
+        return index
+
+    # ---------- routing / search ----------
+    @property
+    def router(self) -> CategoryRouter:
+        # Rebuilt when the shards change: apply_update swaps in a new dict, add_documents resets it
+        shards, cached = self.shards, self._router
+        if cached is None or cached[0] is not shards:
+            cached = self._router = (shards, CategoryRouter({key.split("/")[0] for key in shards}))
+        return cached[1]
+
+    def route(self, query: str) -> List[str]:
+        """
+        Categories to search: the ones whose name or aliases appear in the query
+        (no network, no per-shard scoring). Falls back to every category.
+        """
+        return self.router.route(query) or self.categories
+
+    def _ranked(self, query: str, doc_type: str, limit: int, mode: str, categories: List[str],
+                query_vector: Optional[Callable[[], List[float]]] = None) -> List[Document]:
+        ranked_lists = []
+        for category in categories:
+            shard = self.shards.get(f"{category}/{doc_type}")
+            if shard and limit:
+                ranked_lists.append(hybrid_search(shard[0], shard[1], query, k=limit, mode=mode,
+                                                  query_vector=query_vector))
+        if len(ranked_lists) == 1:
+            return ranked_lists[0][:limit]
+        if ranked_lists:
+            return reciprocal_rank_fusion(ranked_lists, top_n=limit)
+        return []
+
+    def search(self, query: str, k: int = 4, mode: str = "hybrid",
+               k_images: int = IMAGE_RESULTS, categories: Optional[List[str]] = None) -> List[Document]:
+        """
+        Top-k text chunks from the routed shards, followed by up to k_images image
+        hits: exact registry tag matches first, then the best-ranked image shards.
+        """
+        categories = categories or self.route(query)
+        vector: List[List[float]] = []
+
+        def query_vector() -> List[float]:
+            # Embedded at most once per search, and only if some shard needs FAISS
+            if not vector:
+                vector.append(self.embeddings.embed_query(query))
+            return vector[0]
+
+        results = self._ranked(query, "text", k, mode, categories, query_vector)
+        if not k_images:
+            return results
+
+        tag_hits = self.tags.search(query, k=k_images)
+        taken = {d.metadata.get("full_path") for d in tag_hits}
+        images = [d for d in self._ranked(query, "image", k_images, mode, categories, query_vector)
+                  if d.metadata.get("full_path") not in taken]
+        return results + (tag_hits + images)[:k_images]
+
+    def similarity_search(self, query: str, k: int = 4) -> List[Document]:
+        """FAISS-compatible vector-only search across the routed shards."""
+        return self.search(query, k=k, mode="vector")
@@ -0,0 +1,161 @@
+import json
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, List, Optional
+
+from langchain_core.embeddings import Embeddings
+
+TRACE_PATH = os.environ.get("RAG_TRACE_PATH", "rag_traces.jsonl")
+STAGES = ("embedding", "search", "retrieval", "completion", "render", "total")
+
+_current: ContextVar[Optional["Trace"]] = ContextVar("rag_trace", default=None)
+_write_lock = threading.Lock()
+# Streamlit's control-flow exceptions (a rerun or st.stop() landing mid-request) are not failures
+_INTERRUPTS = ("RerunException", "StopException")
+
+
+class Trace:
+    """
+    Per-request timing of the RAG pipeline, used as `with Trace(page) as trace:`.
+    Stages are timed with trace.stage(name); the embedding time spent inside
+    retrieval is captured by TracedEmbeddings, and 'search' is derived as
+    retrieval - embedding. The record is written when the block exits, also when
+    it raises (status 'error' with the exception, or 'interrupted' for a Streamlit
+    rerun/stop), and the exception propagates.
+    """
+
+    def __init__(self, page: str, **fields):
+        self.record = {
+            "id": uuid.uuid4().hex[:12],
+            "ts": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "page": page,
+            **fields,
+        }
+        self.stages: Dict[str, float] = {}
+        self._t0 = time.perf_counter()
+        self._token = None
+        self.finished = False
+
+    def __enter__(self) -> "Trace":
+        self._token = _current.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None and exc_type.__name__ in _INTERRUPTS:
+            self.finish(status="interrupted")
+        else:
+            self.finish(error=f"{exc_type.__name__}: {exc}" if exc_type else None)
+        return False
+
+    def set(self, **fields):
+        self.record.update(fields)
+
+    def add(self, stage: str, ms: float):
+        self.stages[stage] = self.stages.get(stage, 0.0) + ms
+
+    @contextmanager
+    def stage(self, name: str):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, (time.perf_counter() - t0) * 1000)
+
+    def set_usage(self, response):
+        """Token counts from an OpenAI chat completion response."""
+        usage = getattr(response, "usage", None)
+        if usage:
+            self.set(prompt_tokens=usage.prompt_tokens, completion_tokens=usage.completion_tokens)
+
+    def finish(self, path: str = TRACE_PATH, error: Optional[str] = None, status: str = "ok") -> dict:
+        if self.finished:
+            return self.record
+        self.finished = True
+        if self._token is not None:
+            _current.reset(self._token)
+            self._token = None
+
+        self.add("total", (time.perf_counter() - self._t0) * 1000)
+        if "retrieval" in self.stages:
+            self.stages["search"] = max(0.0, self.stages["retrieval"] - self.stages.get("embedding", 0.0))
+        self.record["stages_ms"] = {k: round(v, 2) for k, v in self.stages.items()}
+        self.record["status"] = "error" if error else status
+        if error:
+            self.record["error"] = error
+
+        try:
+            with _write_lock, open(path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(self.record) + "\n")
+        except OSError as e:
+            print(f"Could not write trace: {e}")
+        return self.record
+
+
+class TracedEmbeddings(Embeddings):
+    """Wraps an Embeddings backend and charges query-embedding time to the active Trace."""
+
+    def __init__(self, inner: Embeddings):
+        self.inner = inner
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.inner.embed_documents(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        trace = _current.get()
+        if trace is None:
+            return self.inner.embed_query(text)
+        t0 = time.perf_counter()
+        try:
+            return self.inner.embed_query(text)
+        finally:
+            trace.add("embedding", (time.perf_counter() - t0) * 1000)
+
+
+# ================= SUMMARY =================
+def load_traces(path: str = TRACE_PATH, limit: Optional[int] = None) -> List[dict]:
+    if not os.path.exists(path):
+        return []
+    with open(path, "r", encoding="utf-8") as f:
+        lines = f.readlines()
+    if limit:
+        lines = lines[-limit:]
+    traces = []
+    for line in lines:
+        try:
+            traces.append(json.loads(line))
+        except json.JSONDecodeError:
+            continue
+    return traces
+
+
+def percentile(values: List[float], pct: float) -> Optional[float]:
+    if not values:
+        return None
+    values = sorted(values)
+    idx = min(len(values) - 1, max(0, round(pct / 100 * (len(values) - 1))))
+    return values[idx]
+
+
+def failed(traces: List[dict]) -> List[dict]:
+    return [t for t in traces if t.get("status") == "error"]
+
+
+def stage_summary(traces: List[dict]) -> List[dict]:
+    """count / p50 / p95 / max per stage, over the requests that completed."""
+    traces = [t for t in traces if t.get("status", "ok") == "ok"]
+    rows = []
+    for stage in STAGES:
+        values = [t["stages_ms"][stage] for t in traces if stage in t.get("stages_ms", {})]
+        if values:
+            rows.append({
+                "stage": stage,
+                "count": len(values),
+                "p50_ms": round(percentile(values, 50), 1),
+                "p95_ms": round(percentile(values, 95), 1),
+                "max_ms": round(max(values), 1),
+            })
+    return rows